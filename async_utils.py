@@ -0,0 +1,79 @@
+"""
+Versión asíncrona de las funciones de datos de utils.py, con los mismos nombres
+y argumentos. Cada llamada corre la función de utils en un pool de hilos, así
+que comparte el cliente, la caché, la invalidación y la instrumentación del
+módulo síncrono.
+
+Uso desde una página:
+
+    summary, tasks = async_utils.run(
+        async_utils.get_month_summary(year, month),
+        async_utils.get_month_tasks(year, month)
+    )
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import utils
+
+# Suficientes hilos para las consultas de una página; el límite real de
+# conexiones lo pone maxPoolSize del cliente
+MAX_WORKERS = 16
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="async-utils")
+
+
+def _wrap(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # Copia el contexto para que la instrumentación de utils siga al rerun
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            _executor, functools.partial(context.run, func, *args, **kwargs)
+        )
+    return wrapper
+
+
+def run(*awaitables):
+    """
+    Ejecuta varias consultas a la vez desde código síncrono y devuelve sus
+    resultados en el mismo orden
+    """
+    async def gather():
+        return await asyncio.gather(*awaitables)
+    return asyncio.run(gather())
+
+
+login = _wrap(utils.login)
+add_task = _wrap(utils.add_task)
+add_recurring_task = _wrap(utils.add_recurring_task)
+get_recurring_tasks = _wrap(utils.get_recurring_tasks)
+skip_occurrence = _wrap(utils.skip_occurrence)
+end_recurring_task = _wrap(utils.end_recurring_task)
+delete_recurring_task = _wrap(utils.delete_recurring_task)
+get_month_tasks = _wrap(utils.get_month_tasks)
+get_month_summary = _wrap(utils.get_month_summary)
+get_day_tasks = _wrap(utils.get_day_tasks)
+get_upcoming_tasks = _wrap(utils.get_upcoming_tasks)
+get_task = _wrap(utils.get_task)
+get_task_changes = _wrap(utils.get_task_changes)
+get_task_comments = _wrap(utils.get_task_comments)
+add_comment = _wrap(utils.add_comment)
+mark_as_completed = _wrap(utils.mark_as_completed)
+request_extension = _wrap(utils.request_extension)
+mark_as_impossible = _wrap(utils.mark_as_impossible)
+get_pending_admin_tasks = _wrap(utils.get_pending_admin_tasks)
+approve_extension = _wrap(utils.approve_extension)
+deny_extension = _wrap(utils.deny_extension)
+handle_impossible_task = _wrap(utils.handle_impossible_task)
+get_filtered_tasks = _wrap(utils.get_filtered_tasks)
+get_filtered_tasks_page = _wrap(utils.get_filtered_tasks_page)
+search_tasks = _wrap(utils.search_tasks)
+get_task_statistics = _wrap(utils.get_task_statistics)
+insert_tasks = _wrap(utils.insert_tasks)
+update_task = _wrap(utils.update_task)
+bulk_update_tasks = _wrap(utils.bulk_update_tasks)
+delete_task = _wrap(utils.delete_task)
@@ -0,0 +1 @@
+"""Benchmarks de la capa de datos. Necesitan un mongod al que apunte MONGO_URI; secrets.toml es opcional."""
@@ -0,0 +1,79 @@
+"""
+Uso (con MONGO_URI apuntando a un mongod local; sin .streamlit/secrets.toml
+se usan las opciones por defecto del cliente):
+
+    python -m benchmarks generate --seed 1 --users 3 --tasks-per-day 20 --days 365
+    python -m benchmarks run --seed 1 --repeat 20 --output baseline.json    (en la versión base)
+    python -m benchmarks run --seed 1 --repeat 20 --output results.json     (con el cambio)
+    python -m benchmarks compare results.json baseline.json
+
+La línea base se mide en la misma máquina y con los mismos datos, así que no
+se guarda en el repositorio. Los escenarios no modifican los datos generados,
+de modo que ambas ejecuciones pueden usar el mismo generate. compare termina
+con código 1 si algún escenario es más lento que la base por encima del umbral.
+"""
+import argparse
+import json
+import sys
+
+from benchmarks import generator, results, scenarios
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gen = commands.add_parser("generate", help="llena la base con datos sintéticos")
+    gen.add_argument("--seed", type=int, default=1)
+    gen.add_argument("--users", type=int, default=3)
+    gen.add_argument("--tasks-per-day", type=int, default=20)
+    gen.add_argument("--days", type=int, default=365)
+    gen.add_argument("--comment-alpha", type=float, default=1.5)
+    gen.add_argument("--max-comments", type=int, default=500)
+    gen.add_argument("--force", action="store_true", help="permite escribir en un servidor no local")
+
+    run = commands.add_parser("run", help="mide los escenarios")
+    run.add_argument("--seed", type=int, default=1)
+    run.add_argument("--repeat", type=int, default=20)
+    run.add_argument("--only", nargs="*", help="nombres de escenarios a medir")
+    run.add_argument("--output", help="archivo JSON de resultados")
+
+    cmp = commands.add_parser("compare", help="compara resultados contra una línea base")
+    cmp.add_argument("current")
+    cmp.add_argument("baseline")
+    cmp.add_argument("--threshold", type=float, default=results.DEFAULT_THRESHOLD)
+
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        counts = generator.generate(
+            seed=args.seed,
+            users=args.users,
+            tasks_per_day=args.tasks_per_day,
+            days=args.days,
+            comment_alpha=args.comment_alpha,
+            max_comments=args.max_comments,
+            force=args.force
+        )
+        print(json.dumps(counts))
+
+    elif args.command == "run":
+        measured = scenarios.run_scenarios(seed=args.seed, repeat=args.repeat, names=args.only)
+        output = results.build_results(measured, {"seed": args.seed, "repeat": args.repeat})
+        if args.output:
+            results.save(output, args.output)
+        print(json.dumps(output, indent=2, ensure_ascii=False))
+
+    elif args.command == "compare":
+        rows = results.compare(results.load(args.current), results.load(args.baseline), args.threshold)
+        for row in rows:
+            flag = "REGRESIÓN" if row["regression"] else "ok"
+            print(f"{row['scenario']:28} {row['baseline_ms']:9.2f} ms -> {row['current_ms']:9.2f} ms "
+                  f"({row['change']:+.0%}) {flag}")
+        if any(row["regression"] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
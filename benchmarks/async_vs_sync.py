@@ -0,0 +1,77 @@
+"""
+Compara el tiempo de cargar las consultas de una página una tras otra (utils)
+contra lanzarlas a la vez (async_utils). La caché se vacía antes de cada
+repetición para medir la base de datos y no la caché.
+
+Uso: MONGO_URI=mongodb://localhost:27017 python -m benchmarks.async_vs_sync --repeat 20
+"""
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import async_utils
+import utils
+
+
+def page_queries():
+    """Consultas que hacen el dashboard y el panel de administración en una recarga"""
+    today = datetime.now().date()
+    return {
+        "dashboard": [
+            ("get_month_summary", (today.year, today.month), {}),
+            ("get_month_tasks", (today.year, today.month), {}),
+        ],
+        "task_manager": [
+            ("get_pending_admin_tasks", (), {}),
+            ("get_filtered_tasks_page", (), {
+                "estados": ["pendiente", "completada"],
+                "usuarios": ["Juan", "Jose"],
+                "fecha_inicio": today,
+                "fecha_fin": today + timedelta(days=30)
+            }),
+        ],
+    }
+
+
+def run_sync(queries):
+    return [getattr(utils, name)(*args, **kwargs) for name, args, kwargs in queries]
+
+
+def run_async(queries):
+    return async_utils.run(*(getattr(async_utils, name)(*args, **kwargs) for name, args, kwargs in queries))
+
+
+def measure(runner, queries, repeat):
+    timings = []
+    for _ in range(repeat):
+        utils.clear_cache()
+        start = time.perf_counter()
+        runner(queries)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": statistics.median(timings),
+        "p95_ms": sorted(timings)[max(0, int(len(timings) * 0.95) - 1)],
+        "min_ms": min(timings),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    results = {}
+    for page, queries in page_queries().items():
+        # Una vuelta sin medir para abrir conexiones del pool
+        run_async(queries)
+        results[page] = {
+            "sync": measure(run_sync, queries, args.repeat),
+            "async": measure(run_async, queries, args.repeat),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Generador de datos sintéticos para los benchmarks. Con la misma semilla y los
+mismos parámetros produce siempre los mismos documentos.
+"""
+import random
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import uri_parser
+
+import utils
+
+BASE_USERS = ["Juan", "Jose", "Los dos"]
+# Proporción aproximada de estados en los datos reales
+STATE_WEIGHTS = {
+    "pendiente": 0.55,
+    "completada": 0.35,
+    "extension_solicitada": 0.06,
+    "imposible": 0.04,
+}
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+BATCH_SIZE = 5000
+
+
+def user_names(count):
+    """Los asignados de la app y, si se piden más, usuarios numerados"""
+    names = BASE_USERS[:count]
+    names.extend(f"Usuario {i}" for i in range(len(names) + 1, count + 1))
+    return names
+
+
+def comment_count(rng, alpha, max_comments):
+    """Cantidad de comentarios con cola larga: casi todas pocas, algunas muchas"""
+    return min(int(rng.paretovariate(alpha)) - 1, max_comments)
+
+
+def check_local(uri):
+    """
+    Evita borrar datos de un servidor que no sea local. Revisa la URI antes de
+    conectarse, porque get_client ya crea índices y el resumen en el servidor
+    """
+    if uri.startswith("mongodb+srv://"):
+        raise RuntimeError("El generador solo escribe en un mongod local, no en un clúster SRV")
+    for host, _ in uri_parser.parse_uri(uri)["nodelist"]:
+        if host not in LOCAL_HOSTS:
+            raise RuntimeError(f"El generador solo escribe en un mongod local, no en {host}")
+
+
+def generate(seed=1, users=3, tasks_per_day=20, days=365, start=None,
+             comment_alpha=1.5, max_comments=500, force=False):
+    """
+    Vacía las colecciones de la base users y las llena con datos sintéticos:
+    tasks_per_day tareas por día durante days días desde start, repartidas entre
+    users asignados. Devuelve la cantidad de tareas y comentarios creados
+    """
+    if not force:
+        check_local(utils.mongo_uri())
+    db = utils.get_client()["users"]
+
+    rng = random.Random(seed)
+    start = start or datetime(datetime.now().year, 1, 1)
+    names = user_names(users)
+    states = list(STATE_WEIGHTS)
+    weights = list(STATE_WEIGHTS.values())
+
+    for collection in ("tasks", "comments", "deleted_tasks", "recurring_tasks", "data", "task_daily_summary"):
+        db[collection].drop()
+    utils.ensure_indexes(db)
+    utils.clear_cache()
+
+    db.data.insert_many([
+        {"username": name.lower().replace(" ", "_"), "password": "benchmark"} for name in names
+    ])
+
+    total_tasks = 0
+    total_comments = 0
+    tasks = []
+    comments = []
+
+    def flush():
+        nonlocal tasks, comments
+        if tasks:
+            db.tasks.insert_many(tasks, ordered=False)
+        if comments:
+            db.comments.insert_many(comments, ordered=False)
+        tasks, comments = [], []
+
+    for day in range(days):
+        day_start = start + timedelta(days=day)
+        for _ in range(tasks_per_day):
+            fecha_hora = day_start + timedelta(minutes=rng.randrange(7 * 60, 21 * 60, 15))
+            creada = fecha_hora - timedelta(days=rng.randint(1, 14))
+            estado = rng.choices(states, weights)[0]
+            task_id = ObjectId(rng.getrandbits(96).to_bytes(12, "big"))
+
+            task_comments = [
+                {
+                    "task_id": task_id,
+                    "texto": f"Comentario {i + 1} " + "x" * rng.randint(10, 200),
+                    "fecha": creada + timedelta(minutes=i * 5)
+                }
+                for i in range(comment_count(rng, comment_alpha, max_comments))
+            ]
+
+            tasks.append({
+                "_id": task_id,
+                "nombre": f"Tarea {total_tasks + 1}",
+                "descripcion": "Descripción " + "y" * rng.randint(20, 400),
+                "fecha_hora": fecha_hora,
+                "asignado_a": rng.choice(names),
+                "estado": estado,
+                "fecha_creacion": creada,
+                "ultima_actualizacion": creada,
+                "num_comentarios": len(task_comments),
+                "comentarios_recientes": [
+                    {"texto": c["texto"], "fecha": c["fecha"]} for c in task_comments[-utils.RECENT_COMMENTS:]
+                ],
+                "solicitud_extension": {
+                    "fecha_solicitud": creada,
+                    "razon": "Necesito más tiempo",
+                    "estado": "pendiente"
+                } if estado == "extension_solicitada" else None,
+                "razon_imposible": "Falta material" if estado == "imposible" else None
+            })
+            comments.extend(task_comments)
+            total_tasks += 1
+            total_comments += len(task_comments)
+
+            if len(tasks) >= BATCH_SIZE or len(comments) >= BATCH_SIZE:
+                flush()
+    flush()
+    utils.rebuild_daily_summary()
+
+    return {"tasks": total_tasks, "comments": total_comments}
@@ -0,0 +1,59 @@
+"""Resultados en JSON y comparación contra una línea base guardada."""
+import json
+import platform
+from datetime import datetime
+
+import pymongo
+
+# Una mediana más lenta que la base por encima de este factor es una regresión
+DEFAULT_THRESHOLD = 0.20
+
+
+def build_results(scenarios, params):
+    server = None
+    try:
+        import utils
+        server = utils.get_client().server_info().get("version")
+    except Exception:
+        pass
+    return {
+        "meta": {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pymongo": pymongo.version,
+            "mongodb": server,
+            "params": params,
+        },
+        "scenarios": scenarios,
+    }
+
+
+def save(results, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compara la mediana de cada escenario presente en ambos resultados. Devuelve
+    una fila por escenario con el cambio relativo y si es una regresión
+    """
+    rows = []
+    for name, stats in current["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if base is None:
+            continue
+        change = (stats["median_ms"] - base["median_ms"]) / base["median_ms"] if base["median_ms"] else 0.0
+        rows.append({
+            "scenario": name,
+            "baseline_ms": base["median_ms"],
+            "current_ms": stats["median_ms"],
+            "change": change,
+            "regression": change > threshold,
+        })
+    return rows
@@ -0,0 +1,239 @@
+"""
+Escenarios medidos: cada uno prepara sus argumentos con un Random sembrado
+y llama a una función de utils. Las lecturas se miden con la caché vacía.
+Las escrituras solo tocan tareas propias del benchmark, que se borran al
+terminar, así que varias ejecuciones miden los mismos datos.
+"""
+import random
+import time
+from datetime import datetime, time as dtime, timedelta
+
+import utils
+
+# Escenarios: nombre -> (tipo, función que recibe (rng, contexto) y hace la llamada)
+SCENARIOS = {}
+
+
+def scenario(name, kind="read"):
+    def register(func):
+        SCENARIOS[name] = (kind, func)
+        return func
+    return register
+
+
+def build_context(seed):
+    """Datos de los que eligen los escenarios: meses con tareas e ids existentes"""
+    db = utils.connect_to_mongo("users")
+    first = db.tasks.find_one(sort=[("fecha_hora", 1)], projection={"fecha_hora": 1})
+    last = db.tasks.find_one(sort=[("fecha_hora", -1)], projection={"fecha_hora": 1})
+    if not first:
+        raise RuntimeError("No hay tareas; ejecuta primero el generador")
+    return {
+        "rng": random.Random(seed),
+        "start": first["fecha_hora"],
+        "end": last["fecha_hora"],
+        "users": db.tasks.distinct("asignado_a"),
+        # Tareas creadas por los escenarios de escritura
+        "scratch": [],
+    }
+
+
+def random_day(ctx):
+    span = (ctx["end"] - ctx["start"]).days
+    return (ctx["start"] + timedelta(days=ctx["rng"].randint(0, span))).date()
+
+
+def random_task_id(ctx, query=None):
+    """Una tarea al azar, reproducible con la semilla del contexto"""
+    db = utils.connect_to_mongo("users")
+    day = random_day(ctx)
+    task = db.tasks.find_one(
+        dict(query or {}, fecha_hora={"$gte": datetime.combine(day, dtime.min)}),
+        {"_id": 1},
+        sort=[("fecha_hora", 1)]
+    )
+    return task["_id"] if task else db.tasks.find_one(query or {}, {"_id": 1})["_id"]
+
+
+def scratch_task_id(ctx):
+    """
+    Una copia nueva de una tarea al azar para que un escenario de escritura la
+    modifique o la borre sin tocar los datos generados
+    """
+    db = utils.connect_to_mongo("users")
+    task = db.tasks.find_one({"_id": random_task_id(ctx, {"_id": {"$nin": ctx["scratch"]}})})
+    copy = utils.new_task_document(
+        task["nombre"], task["descripcion"], task["fecha_hora"], task["asignado_a"], task["estado"]
+    )
+    for field in ("solicitud_extension", "razon_imposible"):
+        copy[field] = task.get(field)
+    utils.insert_tasks([copy])
+    ctx["scratch"].append(copy["_id"])
+    return copy["_id"]
+
+
+def remove_scratch(ctx):
+    """Borra las tareas del benchmark con sus comentarios y marcas, y corrige el resumen"""
+    ids = ctx["scratch"]
+    if not ids:
+        return
+    db = utils.connect_to_mongo("users")
+    days = [task["fecha_hora"] for task in db.tasks.find({"_id": {"$in": ids}}, {"fecha_hora": 1})]
+    db.tasks.delete_many({"_id": {"$in": ids}})
+    db.comments.delete_many({"task_id": {"$in": ids}})
+    db.deleted_tasks.delete_many({"task_id": {"$in": ids}})
+    if days:
+        start = datetime.combine(min(days).date(), dtime.min)
+        utils.rebuild_daily_summary(start, datetime.combine(max(days).date(), dtime.min) + timedelta(days=1))
+    ids.clear()
+    utils.clear_cache()
+
+
+@scenario("get_month_tasks")
+def month_tasks(ctx):
+    day = random_day(ctx)
+    return lambda: utils.get_month_tasks(day.year, day.month)
+
+
+@scenario("get_month_summary")
+def month_summary(ctx):
+    day = random_day(ctx)
+    return lambda: utils.get_month_summary(day.year, day.month)
+
+
+@scenario("get_day_tasks")
+def day_tasks(ctx):
+    day = random_day(ctx)
+    return lambda: utils.get_day_tasks(day.year, day.month, day.day)
+
+
+@scenario("get_filtered_tasks")
+def filtered_tasks(ctx):
+    day = random_day(ctx)
+    return lambda: utils.get_filtered_tasks(
+        ["pendiente", "completada"], ctx["users"][:2], day, day + timedelta(days=30)
+    )
+
+
+@scenario("get_filtered_tasks_page")
+def filtered_tasks_page(ctx):
+    day = random_day(ctx)
+    return lambda: utils.get_filtered_tasks_page(
+        ["pendiente", "completada"], ctx["users"][:2], day, day + timedelta(days=30)
+    )
+
+
+@scenario("get_pending_admin_tasks")
+def pending_admin_tasks(ctx):
+    return utils.get_pending_admin_tasks
+
+
+@scenario("get_task_comments")
+def task_comments(ctx):
+    task_id = random_task_id(ctx, {"num_comentarios": {"$gt": 0}})
+    return lambda: utils.get_task_comments(task_id)
+
+
+@scenario("add_task", "write")
+def add_task(ctx):
+    day = random_day(ctx)
+    return lambda: ctx["scratch"].append(
+        utils.add_task("Benchmark", "Tarea de benchmark", day, dtime(12, 0), ctx["users"][0])
+    )
+
+
+@scenario("add_comment", "write")
+def add_comment(ctx):
+    task_id = scratch_task_id(ctx)
+    return lambda: utils.add_comment(task_id, "Comentario de benchmark")
+
+
+@scenario("mark_as_completed", "write")
+def mark_as_completed(ctx):
+    task_id = scratch_task_id(ctx)
+    return lambda: utils.mark_as_completed(task_id)
+
+
+@scenario("request_extension", "write")
+def request_extension(ctx):
+    task_id = scratch_task_id(ctx)
+    return lambda: utils.request_extension(task_id, "Benchmark")
+
+
+@scenario("mark_as_impossible", "write")
+def mark_as_impossible(ctx):
+    task_id = scratch_task_id(ctx)
+    return lambda: utils.mark_as_impossible(task_id, "Benchmark")
+
+
+@scenario("approve_extension", "write")
+def approve_extension(ctx):
+    task_id = scratch_task_id(ctx)
+    day = random_day(ctx)
+    return lambda: utils.approve_extension(task_id, day, dtime(9, 0))
+
+
+@scenario("deny_extension", "write")
+def deny_extension(ctx):
+    task_id = scratch_task_id(ctx)
+    return lambda: utils.deny_extension(task_id, "Benchmark")
+
+
+@scenario("handle_impossible_task", "write")
+def handle_impossible_task(ctx):
+    task_id = scratch_task_id(ctx)
+    return lambda: utils.handle_impossible_task(task_id, "deny", reason="Benchmark")
+
+
+@scenario("update_task", "write")
+def update_task(ctx):
+    task_id = scratch_task_id(ctx)
+    day = random_day(ctx)
+    return lambda: utils.update_task(
+        task_id, "Benchmark", "Tarea de benchmark", day, dtime(10, 0), ctx["users"][0], "pendiente"
+    )
+
+
+@scenario("bulk_update_tasks", "write")
+def bulk_update_tasks(ctx):
+    db = utils.connect_to_mongo("users")
+    tasks = [db.tasks.find_one({"_id": scratch_task_id(ctx)}) for _ in range(20)]
+    return lambda: utils.bulk_update_tasks([(task, {"nombre": "Benchmark"}) for task in tasks])
+
+
+@scenario("delete_task", "write")
+def delete_task(ctx):
+    task_id = scratch_task_id(ctx)
+    return lambda: utils.delete_task(task_id)
+
+
+def run_scenarios(seed=1, repeat=20, names=None):
+    """
+    Ejecuta cada escenario repeat veces. La preparación no se mide y la caché se
+    vacía antes de cada llamada. Devuelve {nombre: estadísticas en ms}
+    """
+    ctx = build_context(seed)
+    results = {}
+    for name, (kind, prepare) in SCENARIOS.items():
+        if names and name not in names:
+            continue
+        timings = []
+        try:
+            for _ in range(repeat):
+                call = prepare(ctx)
+                utils.clear_cache()
+                start = time.perf_counter()
+                call()
+                timings.append((time.perf_counter() - start) * 1000)
+        finally:
+            remove_scratch(ctx)
+        timings.sort()
+        results[name] = {
+            "kind": kind,
+            "repeat": repeat,
+            "median_ms": timings[len(timings) // 2],
+            "p95_ms": timings[max(0, int(len(timings) * 0.95) - 1)],
+            "mean_ms": sum(timings) / len(timings),
+            "min_ms": timings[0],
+        }
+    return results
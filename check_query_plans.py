@@ -0,0 +1,14 @@
+import sys
+import utils
+
+# Uso: python check_query_plans.py
+# Termina con código 1 si alguna consulta de utils.py recorre la colección completa.
+if __name__ == "__main__":
+    try:
+        plans = utils.verify_query_plans()
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+    for name, stages in plans.items():
+        print(f"{name}: {' -> '.join(stages)}")
@@ -0,0 +1,51 @@
+"""
+Calendario mensual dibujado como un solo componente HTML en lugar de una fila
+de st.columns por semana. Cada día muestra sus asignados y un contador por
+estado con el color de ese estado; al hacer clic en un día el componente lo
+devuelve a Python.
+"""
+import calendar
+import os
+from datetime import date
+import streamlit.components.v1 as components
+
+WEEKDAYS = ["Lun", "Mar", "Mie", "Jue", "Vie", "Sab", "Dom"]
+# Mismos estados que los íconos de get_status_color
+STATUS_COLORS = {
+    "pendiente": "#e3b100",
+    "completada": "#21a34a",
+    "imposible": "#dc2626",
+    "extension_solicitada": "#ea7a1c",
+    "default": "#9ca3af",
+}
+
+_component = components.declare_component(
+    "month_grid",
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "month_grid")
+)
+
+
+def month_grid(year, month, summary, selected_day=None, key=None):
+    """
+    Dibuja el mes a partir de get_month_summary. Devuelve el último clic como
+    {"day", "nonce"} o None si todavía no hubo ninguno; el nonce cambia en cada
+    clic, así que sirve para no procesar el mismo clic en varios reruns
+    """
+    today = date.today()
+    days = {
+        str(day): {
+            "asignados": sorted(info["asignados"]),
+            "estados": info["estados"],
+        }
+        for day, info in summary.items()
+    }
+    return _component(
+        weeks=calendar.monthcalendar(year, month),
+        weekdays=WEEKDAYS,
+        days=days,
+        today=today.day if (today.year, today.month) == (year, month) else 0,
+        selected=selected_day,
+        colors=STATUS_COLORS,
+        key=key,
+        default=None
+    )
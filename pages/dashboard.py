@@ -1,8 +1,21 @@
 import streamlit as st
 import calendar
 import datetime
-from datetime import date, datetime, timedelta
+from datetime import date, datetime
 import utils
+import async_utils
+import perf_panel
+from month_grid import month_grid
+
+LIVE_REFRESH_SECONDS = 5
+ADMIN_USER = "rossy"
+# Asignados cuyas tareas le tocan a cada usuario
+USER_ASSIGNEES = {
+    "juan": ["Juan", "Los dos"],
+    "jose": ["Jose", "Los dos"],
+}
+# Horas hacia adelante que cubre el aviso de tareas próximas
+UPCOMING_HOURS = 24
 
 def get_status_color(estado):
     # Asegurarse de que estado sea string
@@ -17,6 +30,20 @@ def get_status_color(estado):
     }
     return estados.get(estado.lower(), "⚪")
 
+def load_month(year, month):
+    """
+    Carga el resumen y las tareas del mes a la vez. Ambas lecturas pasan por la
+    caché de utils, así que cambiar de día no vuelve a consultar la base de datos
+    """
+    summary, tasks = async_utils.run(
+        async_utils.get_month_summary(year, month),
+        async_utils.get_month_tasks(year, month)
+    )
+    return {
+        "summary": summary,
+        "tasks_by_day": utils.group_tasks_by_day(tasks),
+    }
+
 def create_calendar():
     st.set_page_config(page_title="Inicio", page_icon=":smile:", layout="centered", initial_sidebar_state="collapsed")
     if not st.session_state.get("logged_in"):
@@ -25,9 +52,12 @@ def create_calendar():
             st.switch_page("login.py")
         st.stop()
 
+    perf_panel.start("dashboard")
     st.title("Calendario de Tareas")
-    if st.button("recargar"):
-        st.rerun()
+    # Changes made by other users reach the cache through a per-process watcher
+    utils.start_change_watcher()
+    # Comments and status changes are queued when write_behind is enabled
+    utils.start_write_behind()
     
     # Create columns for month/year selection
     col1, col2 = st.columns(2)
@@ -56,61 +86,91 @@ def create_calendar():
     # Get month number from name
     month_num = list(calendar.month_name).index(month)
     
-    # Get all tasks for the selected month
-    month_tasks = utils.get_month_tasks(year, month_num)
-    
-    # Create a dictionary to store tasks by day
-    tasks_by_day = {}
-    for task in month_tasks:
-        try:
-            day = task['fecha_hora'].day
-            if day not in tasks_by_day:
-                tasks_by_day[day] = []
-            tasks_by_day[day].append(task['asignado_a'])
-        except (KeyError, AttributeError):
-            continue
-    
-    # Create calendar
-    cal = calendar.monthcalendar(year, month_num)
+    show_upcoming()
+    show_grid(year, month_num)
+    show_day(year, month_num)
+    perf_panel.show()
+
+def user_assignees():
+    """
+    Asignados cuyas tareas le tocan al usuario con sesión según USER_ASSIGNEES.
+    None (todas) para el administrador y una lista vacía para otro usuario
+    """
+    username = st.session_state.get("username", "")
+    if username == ADMIN_USER:
+        return None
+    return USER_ASSIGNEES.get(username.lower(), [])
+
+# Deadlines across every day, not only the selected one; the query result is
+# reused for a minute by utils, so the refresh is cheap
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def show_upcoming():
+    assignees = user_assignees()
+    if assignees == []:
+        return
+    tasks = utils.get_upcoming_tasks(assignees, UPCOMING_HOURS)
+    if not tasks:
+        return
+
+    lines = [f"⚠️ **{len(tasks)} tareas pendientes vencen en las próximas {UPCOMING_HOURS} horas**"]
+    for task in tasks[:5]:
+        remaining = task['fecha_hora'] - datetime.now()
+        hours, minutes = divmod(max(int(remaining.total_seconds()) // 60, 0), 60)
+        lines.append(
+            f"- {task['fecha_hora'].strftime('%d/%m %H:%M')} · {task.get('nombre', 'Sin nombre')} "
+            f"({task.get('asignado_a', 'Sin asignar')}) · faltan {hours} h {minutes} min"
+        )
+    if len(tasks) > 5:
+        lines.append(f"- y {len(tasks) - 5} más")
+    st.warning("\n".join(lines))
+
+# The grid and the day view rerun on their own every few seconds and read from
+# the cache, which the change watcher keeps up to date
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def show_grid(year, month_num):
+    perf_panel.start("dashboard: calendario", fragment=True)
+
+    # Notify when another session changed this month since the last render
+    version = utils.get_month_version(year, month_num)
+    seen = st.session_state.get("month_version")
+    if seen is not None and seen[0] == (year, month_num) and seen[1] != version:
+        st.toast("Calendario actualizado")
+    st.session_state.month_version = ((year, month_num), version)
+
+    # Get per-day summary for the selected month
+    month_summary = load_month(year, month_num)["summary"]
     
-    # Display calendar
+    # Display calendar as a single element
     st.write("### Calendario")
+    click = month_grid(
+        year, month_num, month_summary,
+        selected_day=st.session_state.get("selected_day"),
+        key="month_grid"
+    )
+
+    # A click selects the day; the day view lives in another fragment, so the
+    # whole page reruns
+    if click and click["nonce"] != st.session_state.get("month_grid_nonce"):
+        st.session_state.month_grid_nonce = click["nonce"]
+        st.session_state.selected_day = click["day"]
+        st.rerun()
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def show_day(year, month_num):
+    perf_panel.start("dashboard: día", fragment=True)
+    current_date = datetime.now()
+
+    # Same cached month load as the grid, so no extra queries
+    month_data = load_month(year, month_num)
     
-    # Create header with day names
-    days = ["Lun", "Mar", "Mie", "Jue", "Vie", "Sab", "Dom"]
-    cols = st.columns(7)
-    for i, day in enumerate(days):
-        cols[i].write(f"**{day}**")
-    
-    # Display calendar grid
-    for week in cal:
-        cols = st.columns(7)
-        for i, day in enumerate(week):
-            if day == 0:
-                cols[i].write("")
-            else:
-                # Check if this is today's date
-                is_today = (date.today().day == day and 
-                          date.today().month == month_num and 
-                          date.today().year == year)
-                
-                # Get users with tasks for this day
-                users_with_tasks = tasks_by_day.get(day, [])
-                # Remove duplicates and join
-                users_text = ", ".join(set(users_with_tasks)) if users_with_tasks else ""
-                
-                # Display day and users
-                if is_today:
-                    cols[i].markdown(f"**:blue[{day}]**\n{users_text}")
-                else:
-                    cols[i].write(f"{day}\n{users_text}")
-    
-    # Date selection
+    # Date selection, also set by clicking a day in the grid
+    if "selected_day" not in st.session_state:
+        st.session_state.selected_day = min(current_date.day, calendar.monthrange(year, month_num)[1])
     selected_day = st.number_input(
         "Selecciona el día",
         min_value=1,
         max_value=31,
-        value=min(current_date.day, calendar.monthrange(year, month_num)[1])
+        key="selected_day"
     )
     
     # Display selected date
@@ -120,81 +180,133 @@ def create_calendar():
         st.write("Día de la semana:", selected_date.strftime("%A"))
         
         # Get and display tasks for selected day
-        day_tasks = utils.get_day_tasks(year, month_num, selected_day)
+        day_tasks = month_data["tasks_by_day"].get(selected_day, [])
         
         # button to add task
         if st.button("Agregar tarea"):
-            if st.session_state.username != "rossy":
+            if st.session_state.username != ADMIN_USER:
                 st.error("No tienes permisos para agregar tareas")
                 st.stop()
             st.switch_page("pages/task.py")
         
         if st.button("Administrar tareas"):
-            if st.session_state.username != "rossy":
+            if st.session_state.username != ADMIN_USER:
                 st.error("No tienes permisos para administrar tareas")
                 st.stop()
             st.switch_page("pages/task_manager.py")
+
+        if st.button("Estadísticas"):
+            st.switch_page("pages/statistics.py")
             
         # Display tasks
         if day_tasks:
             st.write("### Tareas del día")
             for task in day_tasks:
-                try:
-                    with st.expander(f"{task.get('nombre', 'Sin nombre')} - {task.get('asignado_a', 'Sin asignar')} {get_status_color(task.get('estado', ''))}"):
-                        # Task details
-                        st.write(f"**Descripción:** {task.get('descripcion', 'Sin descripción')}")
-                        st.write(f"**Hora:** {task['fecha_hora'].strftime('%H:%M')}")
-                        st.write(f"**Estado:** {task.get('estado', 'Sin estado')}")
-                        
-                        # Time alert
-                        time_remaining = task['fecha_hora'] - datetime.now()
-                        if time_remaining > timedelta(0) and time_remaining < timedelta(hours=3):
-                            st.warning("⚠️ ALERTA: POCO TIEMPO DISPONIBLE")
-                        
-                        # Action buttons
-                        col1, col2, col3, col4 = st.columns(4)
-                        
-                        with col1:
-                            if st.button("✅ Completada", key=f"complete_{task['_id']}"):
-                                utils.mark_as_completed(task['_id'])
-                                st.rerun()
-                                
-                        
-                        with col2:
-                            reason = st.text_input("Razón de la extensión:", key=f"reason_{task['_id']}")
-                            if st.button("Enviar solicitud", key=f"send_{task['_id']}"):
-                                utils.request_extension(task['_id'], reason)
-                                    
-                        
-                        with col3:
-                            reason = st.text_input("Razón:", key=f"imp_reason_{task['_id']}")
-                            if st.button("Marcar como imposible", key=f"mark_{task['_id']}"):
-                                utils.mark_as_impossible(task['_id'], reason)
-                                    
-                        
-                        with col4:
-                            comment = st.text_input("Nuevo comentario:", key=f"comment_{task['_id']}")
-                            if st.button("📝 Agregar comentario", key=f"add_comment_{task['_id']}"):
-                                utils.add_comment(task['_id'], comment)
-                                st.rerun()
-                                
-                        
-                        # Display comments
-                        comments = task.get('comentarios', [])
-                        if comments:
-                            st.write("**Comentarios:**")
-                            for comment in comments:
-                                try:
-                                    st.write(f"- {comment['fecha'].strftime('%Y-%m-%d %H:%M')}: {comment['texto']}")
-                                except (KeyError, AttributeError):
-                                    continue
-                except Exception as e:
-                    st.error(f"Error al mostrar tarea: {str(e)}")
+                show_task_card(task)
         else:
             st.info("No hay tareas para este día")
             
     except ValueError:
         st.error("Fecha inválida")
 
+# Each card is its own fragment: an action reruns and re-queries only this task,
+# the grid and the day view catch up on their next refresh
+@st.fragment
+def show_task_card(task):
+    # Keys keep the id the card was created with, even after a recurring
+    # occurrence is saved as a real task
+    card_id = task['_id']
+    reload_key = f"reload_task_{card_id}"
+    notice_key = f"notice_task_{card_id}"
+    task_key = f"card_task_{card_id}"
+    if st.session_state.pop(reload_key, False):
+        perf_panel.start("dashboard: tarea", fragment=True)
+        task = utils.get_task(card_id)
+        if task is None:
+            st.session_state.pop(task_key, None)
+            st.info("La tarea ya no existe")
+            return
+        st.session_state[task_key] = task
+    else:
+        # A fragment rerun gets the task it was registered with; the version
+        # reloaded after the last action is newer until show_day refreshes
+        reloaded = st.session_state.get(task_key)
+        if reloaded is not None and (reloaded.get('ultima_actualizacion') or datetime.min) > (task.get('ultima_actualizacion') or datetime.min):
+            task = reloaded
+
+    def refresh(result):
+        # A conflict or a deleted task is reported after reloading the card
+        if not result:
+            st.session_state[notice_key] = result.message
+        st.session_state[reload_key] = True
+        st.rerun(scope="fragment")
+
+    notice = st.session_state.pop(notice_key, None)
+    if notice:
+        st.warning(notice)
+    expected = task.get('ultima_actualizacion')
+
+    try:
+        with st.expander(f"{task.get('nombre', 'Sin nombre')} - {task.get('asignado_a', 'Sin asignar')} {get_status_color(task.get('estado', ''))}"):
+            # Task details
+            st.write(f"**Descripción:** {task.get('descripcion', 'Sin descripción')}")
+            st.write(f"**Hora:** {task['fecha_hora'].strftime('%H:%M')}")
+            st.write(f"**Estado:** {task.get('estado', 'Sin estado')}")
+            
+            # Action buttons
+            col1, col2, col3, col4 = st.columns(4)
+            
+            with col1:
+                if st.button("✅ Completada", key=f"complete_{card_id}"):
+                    refresh(utils.mark_as_completed(task['_id'], expected=expected))
+                    
+            
+            with col2:
+                reason = st.text_input("Razón de la extensión:", key=f"reason_{card_id}")
+                if st.button("Enviar solicitud", key=f"send_{card_id}"):
+                    refresh(utils.request_extension(task['_id'], reason, expected=expected))
+                        
+            
+            with col3:
+                reason = st.text_input("Razón:", key=f"imp_reason_{card_id}")
+                if st.button("Marcar como imposible", key=f"mark_{card_id}"):
+                    refresh(utils.mark_as_impossible(task['_id'], reason, expected=expected))
+                        
+            
+            with col4:
+                comment = st.text_input("Nuevo comentario:", key=f"comment_{card_id}")
+                if st.button("📝 Agregar comentario", key=f"add_comment_{card_id}"):
+                    refresh(utils.add_comment(task['_id'], comment, expected=expected))
+                    
+            
+            # An unsaved occurrence of a recurring task can be skipped without
+            # creating a real task; the whole page reruns so the day drops it
+            if task.get('virtual') and st.button("⏭️ Omitir ocurrencia", key=f"skip_{card_id}"):
+                if utils.skip_occurrence(task['_id']):
+                    st.rerun()
+                st.error("La tarea recurrente ya no existe")
+
+            # Display comments, loaded only when requested
+            num_comments = task.get('num_comentarios', 0)
+            if num_comments and st.toggle(f"Ver comentarios ({num_comments})", key=f"show_comments_{card_id}"):
+                st.write("**Comentarios:**")
+                pages_key = f"comment_pages_{card_id}"
+                pages = st.session_state.get(pages_key, 1)
+                cursor = None
+                for _ in range(pages):
+                    comments, cursor = utils.get_task_comments(task['_id'], cursor=cursor)
+                    for comment in comments:
+                        try:
+                            st.write(f"- {comment['fecha'].strftime('%Y-%m-%d %H:%M')}: {comment['texto']}")
+                        except (KeyError, AttributeError):
+                            continue
+                    if cursor is None:
+                        break
+                if cursor is not None and st.button("Ver más comentarios", key=f"more_comments_{card_id}"):
+                    st.session_state[pages_key] = pages + 1
+                    st.rerun(scope="fragment")
+    except Exception as e:
+        st.error(f"Error al mostrar tarea: {str(e)}")
+
 if __name__ == "__main__":
     create_calendar()
\ No newline at end of file
@@ -0,0 +1,80 @@
+import streamlit as st
+import pandas as pd
+import utils
+import perf_panel
+from datetime import datetime, timedelta
+
+def rate(part, total):
+    return round(100 * part / total, 1) if total else 0.0
+
+def assignee_frame(rows):
+    """Tabla por asignado con conteos y porcentajes"""
+    df = pd.DataFrame(rows)
+    if df.empty:
+        return df
+    df = df.set_index("asignado_a")
+    df["% completadas"] = [rate(c, t) for c, t in zip(df["completadas"], df["total"])]
+    df["% vencidas"] = [rate(v, t) for v, t in zip(df["vencidas"], df["total"])]
+    df["% con extensión"] = [rate(e, t) for e, t in zip(df["con_extension"], df["total"])]
+    df["% imposibles"] = [rate(i, t) for i, t in zip(df["imposibles"], df["total"])]
+    return df
+
+def create_statistics_page():
+    st.set_page_config(page_title="Estadísticas", page_icon="📊", layout="wide", initial_sidebar_state="collapsed")
+
+    if not st.session_state.get("logged_in"):
+        st.write("Por favor inicia sesión")
+        if st.button("Iniciar sesión"):
+            st.switch_page("login.py")
+        st.stop()
+
+    perf_panel.start("statistics")
+    st.title("Estadísticas del Equipo")
+
+    if st.button("Volver"):
+        st.switch_page("pages/dashboard.py")
+
+    today = datetime.now().date()
+    date_range = st.date_input(
+        "Rango de fechas",
+        value=(today - timedelta(days=30), today),
+        key="statistics_range"
+    )
+    fecha_inicio = date_range[0]
+    fecha_fin = date_range[1] if len(date_range) > 1 else date_range[0]
+
+    # Una sola agregación por rango, cacheada en utils
+    stats = utils.get_task_statistics(fecha_inicio, fecha_fin)
+    totales = stats["totales"]
+
+    if not totales["total"]:
+        st.info("No hay tareas en este rango")
+        perf_panel.show()
+        return
+
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("Tareas", totales["total"])
+    col2.metric("Completadas", f"{rate(totales['completadas'], totales['total'])}%")
+    col3.metric("Vencidas", totales["vencidas"])
+    col4.metric("Con extensión", f"{rate(totales['con_extension'], totales['total'])}%")
+    col5.metric("Imposibles", f"{rate(totales['imposibles'], totales['total'])}%")
+
+    st.write("### Por asignado")
+    by_assignee = assignee_frame(stats["por_asignado"])
+    st.dataframe(by_assignee, use_container_width=True)
+    st.bar_chart(by_assignee[["% completadas", "% vencidas", "% con extensión", "% imposibles"]], stack=False)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.write("### Por estado")
+        st.bar_chart(pd.Series(stats["por_estado"], name="tareas"))
+    with col2:
+        st.write("### Por semana")
+        by_week = pd.DataFrame(stats["por_semana"])
+        if not by_week.empty:
+            st.line_chart(by_week.set_index("semana")[["total", "completadas", "vencidas"]])
+
+    perf_panel.show()
+
+if __name__ == "__main__":
+    create_statistics_page()
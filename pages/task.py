@@ -26,7 +26,28 @@ with col2:
 
 with col3:
     assigned_to = st.selectbox("Asignado a", ["Juan", "Jose", "Los dos"])
+    recurring = st.checkbox("Tarea recurrente")
+    if recurring:
+        frequency = st.selectbox("Frecuencia", list(utils.RECURRENCE_FREQUENCIES))
+        interval = st.number_input("Repetir cada", min_value=1, max_value=365, value=1)
+        weekdays = []
+        if frequency == "semanal":
+            day_names = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
+            weekdays = st.multiselect(
+                "Días de la semana",
+                range(7),
+                default=[task_date.weekday()],
+                format_func=lambda day: day_names[day]
+            )
+        until_date = st.date_input("Repetir hasta", value=None, min_value=task_date)
+
     if st.button("Agregar tarea"):
-        utils.add_task(task_name, task_description, task_date, task_time, assigned_to)
+        if recurring:
+            utils.add_recurring_task(
+                task_name, task_description, task_date, task_time, assigned_to,
+                frequency, interval, weekdays, until_date
+            )
+        else:
+            utils.add_task(task_name, task_description, task_date, task_time, assigned_to)
         st.success("Tarea agregada")
         
@@ -1,11 +1,12 @@
 import streamlit as st
+import pandas as pd
 import utils
+import perf_panel
+import task_io
+import tempfile
 from datetime import datetime, timedelta
 
-def show_requests_tab():
-    # Obtener tareas pendientes de revisión
-    pending_tasks = utils.get_pending_admin_tasks()
-
+def show_requests_tab(pending_tasks):
     if not pending_tasks:
         st.info("No hay tareas pendientes de revisión")
         return
@@ -49,18 +50,22 @@ def show_requests_tab():
                 
                 with col3:
                     if st.button("✅ Aprobar", key=f"approve_{task['_id']}"):
-                        if utils.approve_extension(task['_id'], new_date, new_time):
+                        result = utils.approve_extension(task['_id'], new_date, new_time, expected=task.get('ultima_actualizacion'))
+                        if result:
                             st.success("Extensión aprobada")
                             st.rerun()
+                        st.error(result.message)
 
                 reason = st.text_input(
                     "Razón de la denegación:",
                     key=f"deny_reason_{task['_id']}"
                 )
                 if st.button("❌ Denegar", key=f"deny_{task['_id']}"):
-                    if utils.deny_extension(task['_id'], reason):
+                    result = utils.deny_extension(task['_id'], reason, expected=task.get('ultima_actualizacion'))
+                    if result:
                         st.success("Extensión denegada")
                         st.rerun()
+                    st.error(result.message)
 
     # Mostrar tareas marcadas como imposibles
     if impossible_tasks:
@@ -91,20 +96,25 @@ def show_requests_tab():
                         key=f"new_desc_{task['_id']}"
                     )
                     if st.button("Guardar cambios", key=f"save_{task['_id']}"):
-                        if utils.handle_impossible_task(
+                        result = utils.handle_impossible_task(
                             task['_id'],
                             "accept",
                             new_name=new_name,
-                            new_description=new_description
-                        ):
+                            new_description=new_description,
+                            expected=task.get('ultima_actualizacion')
+                        )
+                        if result:
                             st.success("Tarea modificada exitosamente")
                             st.rerun()
+                        st.error(result.message)
                 
                 elif action == "Eliminar tarea":
                     if st.button("Confirmar eliminación", key=f"delete_{task['_id']}"):
-                        if utils.handle_impossible_task(task['_id'], "accept"):
+                        result = utils.handle_impossible_task(task['_id'], "accept", expected=task.get('ultima_actualizacion'))
+                        if result:
                             st.success("Tarea eliminada exitosamente")
                             st.rerun()
+                        st.error(result.message)
                 
                 elif action == "Denegar solicitud":
                     reason = st.text_input(
@@ -112,11 +122,33 @@ def show_requests_tab():
                         key=f"imp_deny_reason_{task['_id']}"
                     )
                     if reason and st.button("Confirmar denegación", key=f"deny_imp_{task['_id']}"):
-                        if utils.handle_impossible_task(task['_id'], "deny", reason=reason):
+                        result = utils.handle_impossible_task(
+                            task['_id'], "deny", reason=reason, expected=task.get('ultima_actualizacion')
+                        )
+                        if result:
                             st.success("Solicitud denegada")
                             st.rerun()
+                        st.error(result.message)
+
+def _keep(key):
+    st.session_state[key] = st.session_state[f"_{key}"]
+
+def persistent(key, default):
+    """
+    Argumentos para un widget cuyo valor debe sobrevivir mientras no se dibuja
+    (por ejemplo en la otra sección). Streamlit borra el estado de los widgets
+    ausentes, así que el valor se guarda en key y el widget usa _key
+    """
+    if key not in st.session_state:
+        st.session_state[key] = default
+    st.session_state[f"_{key}"] = st.session_state[key]
+    return {"key": f"_{key}", "on_change": _keep, "args": (key,)}
 
-def show_management_tab():
+def show_management_filters():
+    """
+    Dibuja los filtros de gestión y devuelve el texto buscado y los argumentos
+    de get_filtered_tasks_page / search_tasks
+    """
     st.header("Gestión de Tareas")
     
     # Filtros
@@ -125,99 +157,339 @@ def show_management_tab():
         filter_status = st.multiselect(
             "Filtrar por estado",
             ["pendiente", "completada", "extension_solicitada", "imposible"],
-            default=["pendiente", "completada"]
+            **persistent("filter_status", ["pendiente", "completada"])
         )
     with col2:
         filter_user = st.multiselect(
             "Filtrar por usuario",
             ["Juan", "Jose", "Los dos"],
-            default=["Juan", "Jose"]
+            **persistent("filter_user", ["Juan", "Jose"])
         )
     with col3:
         date_range = st.date_input(
             "Rango de fechas",
-            value=(datetime.now().date(), (datetime.now() + timedelta(days=30)).date()),
-            key="date_range"
+            **persistent("date_range", (datetime.now().date(), (datetime.now() + timedelta(days=30)).date()))
         )
 
-    # Obtener tareas filtradas
-    tasks = utils.get_filtered_tasks(
-        estados=filter_status,
-        usuarios=filter_user,
-        fecha_inicio=date_range[0],
-        fecha_fin=date_range[1] if len(date_range) > 1 else date_range[0]
-    )
+    search_text = st.text_input(
+        "Buscar",
+        placeholder="Nombre, descripción o comentarios",
+        **persistent("search_text", "")
+    ).strip()
+
+    fecha_inicio = date_range[0]
+    fecha_fin = date_range[1] if len(date_range) > 1 else date_range[0]
+
+    # Las páginas visitadas se guardan como una pila de cursores; se reinicia
+    # cuando cambian los filtros o la búsqueda
+    filters = (tuple(filter_status), tuple(filter_user), fecha_inicio, fecha_fin, search_text)
+    if st.session_state.get("management_filters") != filters:
+        st.session_state.management_filters = filters
+        st.session_state.management_cursors = [None]
+
+    return search_text, {
+        "estados": filter_status,
+        "usuarios": filter_user,
+        "fecha_inicio": fecha_inicio,
+        "fecha_fin": fecha_fin,
+        "cursor": st.session_state.management_cursors[-1]
+    }
+
+def show_management_tab(tasks, next_cursor):
+    cursors = st.session_state.management_cursors
+
+    if not tasks and len(cursors) > 1:
+        # La página quedó vacía (por ejemplo tras eliminar su última tarea)
+        cursors.pop()
+        st.rerun()
 
     if not tasks:
         st.info("No hay tareas que coincidan con los filtros seleccionados")
         return
 
-    # Mostrar tareas
+    # Edición en lote: una tabla editable sobre la página actual
+    if st.toggle("📝 Edición en lote", **persistent("batch_edit", False)):
+        show_batch_editor(tasks)
+    else:
+        show_task_list(tasks)
+
+    # Navegación entre páginas
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if len(cursors) > 1 and st.button("⬅️ Anterior", key="management_prev"):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        st.write(f"Página {len(cursors)}")
+    with col3:
+        if next_cursor is not None and st.button("Siguiente ➡️", key="management_next"):
+            cursors.append(next_cursor)
+            st.rerun()
+
+def show_task_list(tasks):
     for task in tasks:
         with st.expander(f"{task['nombre']} - {task['asignado_a']} ({task['estado']})"):
+            st.write(f"**Fecha:** {task['fecha_hora'].strftime('%Y-%m-%d %H:%M')}")
+            st.write(f"**Descripción:** {task['descripcion']}")
+
+            # Los widgets de edición solo se construyen para la tarea que se está editando
+            if st.toggle("✏️ Editar", key=f"edit_toggle_{task['_id']}"):
+                show_edit_form(task)
+
+            num_comments = task.get('num_comentarios', 0)
+            if num_comments:
+                st.write("**Comentarios:**")
+                # Historial completo bajo demanda; si no, solo los más recientes
+                if st.toggle(f"Ver historial ({num_comments})", key=f"history_{task['_id']}"):
+                    show_comment_history(task['_id'])
+                else:
+                    for comment in reversed(task.get('comentarios_recientes', [])):
+                        st.write(f"- {comment['fecha'].strftime('%Y-%m-%d %H:%M')}: {comment['texto']}")
+
+BATCH_FIELDS = ["nombre", "descripcion", "fecha_hora", "asignado_a", "estado"]
+
+def show_batch_editor(tasks):
+    original = {str(task['_id']): task for task in tasks}
+    df = pd.DataFrame(
+        [{"id": task_id, **{field: task.get(field) for field in BATCH_FIELDS}} for task_id, task in original.items()]
+    ).set_index("id")
+
+    # La clave depende de las tareas mostradas para no aplicar ediciones de otra página
+    editor_key = f"batch_editor_{hash(tuple(original))}"
+    edited = st.data_editor(
+        df,
+        key=editor_key,
+        use_container_width=True,
+        column_config={
+            "nombre": st.column_config.TextColumn("Nombre", required=True),
+            "descripcion": st.column_config.TextColumn("Descripción"),
+            "fecha_hora": st.column_config.DatetimeColumn("Fecha y hora", format="YYYY-MM-DD HH:mm", required=True),
+            "asignado_a": st.column_config.SelectboxColumn("Asignado a", options=["Juan", "Jose", "Los dos"], required=True),
+            # Las solicitudes de extensión e imposibles solo las crea el
+            # asignado, con su razón; aquí, igual que en show_edit_form, no
+            "estado": st.column_config.SelectboxColumn(
+                "Estado",
+                options=["pendiente", "completada"],
+                required=True
+            ),
+        }
+    )
+
+    # Solo se envían los campos que cambiaron
+    updates = []
+    for task_id, row in edited.iterrows():
+        task = original[task_id]
+        changes = {}
+        for field in BATCH_FIELDS:
+            value = row[field]
+            if pd.isna(value):
+                continue
+            if isinstance(value, pd.Timestamp):
+                value = value.to_pydatetime()
+            if value != task.get(field):
+                changes[field] = value
+        if changes:
+            updates.append((task, changes))
+
+    if st.button(f"💾 Guardar cambios en lote ({len(updates)})", disabled=not updates, key="save_batch"):
+        results = utils.bulk_update_tasks(updates)
+        st.session_state.batch_report = [
+            {
+                "Tarea": original[str(result['task_id'])]['nombre'],
+                "Campos": ", ".join(result['campos']),
+                "Resultado": "✅ Guardada" if result['ok'] else f"❌ {result['error']}"
+            }
+            for result in results
+        ]
+        st.session_state.pop(editor_key, None)
+        st.rerun()
+
+    report = st.session_state.get("batch_report")
+    if report:
+        st.write("**Resultado del último guardado:**")
+        st.dataframe(pd.DataFrame(report), hide_index=True, use_container_width=True)
+
+def show_comment_history(task_id):
+    pages_key = f"history_pages_{task_id}"
+    pages = st.session_state.get(pages_key, 1)
+    cursor = None
+    for _ in range(pages):
+        comments, cursor = utils.get_task_comments(task_id, cursor=cursor)
+        for comment in comments:
+            st.write(f"- {comment['fecha'].strftime('%Y-%m-%d %H:%M')}: {comment['texto']}")
+        if cursor is None:
+            break
+    if cursor is not None and st.button("Ver más comentarios", key=f"more_history_{task_id}"):
+        st.session_state[pages_key] = pages + 1
+        st.rerun()
+
+def show_edit_form(task):
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        new_name = st.text_input(
+            "Nombre:",
+            value=task['nombre'],
+            key=f"edit_name_{task['_id']}"
+        )
+        new_description = st.text_area(
+            "Descripción:",
+            value=task['descripcion'],
+            key=f"edit_desc_{task['_id']}"
+        )
+        new_assigned = st.selectbox(
+            "Asignado a:",
+            ["Juan", "Jose", "Los dos"],
+            index=0 if task['asignado_a'] == "Juan" else 1,
+            key=f"edit_assigned_{task['_id']}"
+        )
+    
+    with col2:
+        new_date = st.date_input(
+            "Fecha:",
+            value=task['fecha_hora'].date(),
+            key=f"edit_date_{task['_id']}"
+        )
+        new_time = st.time_input(
+            "Hora:",
+            value=task['fecha_hora'].time(),
+            key=f"edit_time_{task['_id']}"
+        )
+        new_status = st.selectbox(
+            "Estado:",
+            ["pendiente", "completada"],
+            index=0 if task['estado'] == "pendiente" else 1,
+            key=f"edit_status_{task['_id']}"
+        )
+
+    col3, col4 = st.columns([3, 1])
+    with col3:
+        if st.button("💾 Guardar cambios", key=f"save_changes_{task['_id']}"):
+            result = utils.update_task(
+                task['_id'],
+                new_name,
+                new_description,
+                new_date,
+                new_time,
+                new_assigned,
+                new_status,
+                expected=task.get('ultima_actualizacion')
+            )
+            if result:
+                st.success("Cambios guardados exitosamente")
+                st.rerun()
+            st.error(result.message)
+    
+    with col4:
+        if st.button("🗑️ Eliminar", key=f"delete_task_{task['_id']}"):
+            result = utils.delete_task(task['_id'], expected=task.get('ultima_actualizacion'))
+            if result:
+                st.success("Tarea eliminada exitosamente")
+                st.rerun()
+            st.error(result.message)
+
+def show_io_tab():
+    st.header("Exportar / Importar")
+
+    # La exportación usa los mismos filtros que la sección de gestión
+    filter_status = st.session_state.get("filter_status", ["pendiente", "completada"])
+    filter_user = st.session_state.get("filter_user", ["Juan", "Jose"])
+    date_range = st.session_state.get("date_range", (datetime.now().date(), (datetime.now() + timedelta(days=30)).date()))
+    fecha_inicio = date_range[0]
+    fecha_fin = date_range[1] if len(date_range) > 1 else date_range[0]
+
+    st.subheader("Exportar")
+    st.caption(
+        f"Estados: {', '.join(filter_status) or 'todos'} · Usuarios: {', '.join(filter_user) or 'todos'} · "
+        f"{fecha_inicio.strftime('%d/%m/%Y')} - {fecha_fin.strftime('%d/%m/%Y')}"
+    )
+    export_format = st.radio("Formato", task_io.FORMATS, horizontal=True, key="export_format")
+    if st.button("Generar archivo"):
+        # El archivo se escribe por lotes en disco; la descarga lo lee al final
+        with tempfile.TemporaryFile() as output:
+            total = task_io.export_tasks(
+                output,
+                export_format,
+                estados=filter_status,
+                usuarios=filter_user,
+                fecha_inicio=fecha_inicio,
+                fecha_fin=fecha_fin
+            )
+            output.seek(0)
+            st.session_state.export_file = (export_format, output.read())
+        st.success(f"{total} tareas exportadas")
+
+    if "export_file" in st.session_state:
+        export_format, data = st.session_state.export_file
+        # Una vez descargado el archivo no se guarda en la sesión
+        st.download_button(
+            "Descargar",
+            data,
+            file_name=f"tareas.{export_format}",
+            mime="text/csv" if export_format == "csv" else "application/octet-stream",
+            on_click=st.session_state.pop,
+            args=("export_file", None)
+        )
+
+    st.subheader("Importar")
+    uploaded = st.file_uploader("Archivo CSV o Parquet", type=list(task_io.FORMATS))
+    if uploaded and st.button("Importar tareas"):
+        try:
+            report = task_io.import_tasks(uploaded, task_io.format_for(uploaded.name))
+        except Exception as e:
+            st.error(f"No se pudo leer el archivo: {e}")
+            return
+        st.success(f"{report['insertadas']} tareas importadas")
+        if report["errores"]:
+            st.warning(f"{len(report['errores'])} filas con errores")
+            st.dataframe(pd.DataFrame(report["errores"]), hide_index=True, use_container_width=True)
+
+def describe_rrule(rrule):
+    """Texto corto de una regla de add_recurring_task, p. ej. semanal cada 2 (MO,WE)"""
+    parts = dict(part.split("=", 1) for part in rrule.split(";"))
+    frequency = {code: name for name, code in utils.RECURRENCE_FREQUENCIES.items()}.get(parts.get("FREQ"), parts.get("FREQ"))
+    text = f"{frequency} cada {parts.get('INTERVAL', '1')}"
+    if "BYDAY" in parts:
+        text += f" ({parts['BYDAY']})"
+    return text
+
+def show_recurring_tab(definitions):
+    st.header("Tareas Recurrentes")
+    if not definitions:
+        st.info("No hay tareas recurrentes")
+        return
+
+    for definition in definitions:
+        definition_id = definition['_id']
+        hasta = definition.get('hasta')
+        with st.expander(f"🔁 {definition['nombre']} - {definition['asignado_a']} ({describe_rrule(definition['rrule'])})"):
+            st.write(f"**Descripción:** {definition['descripcion']}")
+            st.write(f"**Desde:** {definition['dtstart'].strftime('%Y-%m-%d %H:%M')}")
+            st.write(f"**Hasta:** {hasta.strftime('%Y-%m-%d') if hasta else 'sin fin'}")
+            st.write(f"**Ocurrencias omitidas:** {len(definition.get('excepciones', []))}")
+
             col1, col2 = st.columns(2)
-            
             with col1:
-                new_name = st.text_input(
-                    "Nombre:",
-                    value=task['nombre'],
-                    key=f"edit_name_{task['_id']}"
-                )
-                new_description = st.text_area(
-                    "Descripción:",
-                    value=task['descripcion'],
-                    key=f"edit_desc_{task['_id']}"
-                )
-                new_assigned = st.selectbox(
-                    "Asignado a:",
-                    ["Juan", "Jose", "Los dos"],
-                    index=0 if task['asignado_a'] == "Juan" else 1,
-                    key=f"edit_assigned_{task['_id']}"
-                )
-            
-            with col2:
-                new_date = st.date_input(
-                    "Fecha:",
-                    value=task['fecha_hora'].date(),
-                    key=f"edit_date_{task['_id']}"
-                )
-                new_time = st.time_input(
-                    "Hora:",
-                    value=task['fecha_hora'].time(),
-                    key=f"edit_time_{task['_id']}"
-                )
-                new_status = st.selectbox(
-                    "Estado:",
-                    ["pendiente", "completada"],
-                    index=0 if task['estado'] == "pendiente" else 1,
-                    key=f"edit_status_{task['_id']}"
+                last_date = st.date_input(
+                    "Última fecha",
+                    value=datetime.now().date(),
+                    min_value=definition['dtstart'].date(),
+                    key=f"end_date_{definition_id}"
                 )
-
-            col3, col4 = st.columns([3, 1])
-            with col3:
-                if st.button("💾 Guardar cambios", key=f"save_changes_{task['_id']}"):
-                    if utils.update_task(
-                        task['_id'],
-                        new_name,
-                        new_description,
-                        new_date,
-                        new_time,
-                        new_assigned,
-                        new_status
-                    ):
-                        st.success("Cambios guardados exitosamente")
+                if st.button("⏹️ Terminar", key=f"end_recurring_{definition_id}"):
+                    if utils.end_recurring_task(definition_id, last_date):
+                        st.success("Tarea recurrente terminada")
                         st.rerun()
-            
-            with col4:
-                if st.button("🗑️ Eliminar", key=f"delete_task_{task['_id']}"):
-                    if utils.delete_task(task['_id']):
-                        st.success("Tarea eliminada exitosamente")
+                    st.error("La tarea recurrente ya no existe")
+            with col2:
+                # Las ocurrencias ya guardadas como tareas reales no se borran
+                if st.button("🗑️ Eliminar", key=f"delete_recurring_{definition_id}"):
+                    if utils.delete_recurring_task(definition_id):
+                        st.success("Tarea recurrente eliminada")
                         st.rerun()
+                    st.error("La tarea recurrente ya no existe")
 
-            if task['comentarios']:
-                st.write("**Comentarios:**")
-                for comment in task['comentarios']:
-                    st.write(f"- {comment['fecha'].strftime('%Y-%m-%d %H:%M')}: {comment['texto']}")
+SECTIONS = ["📋 Solicitudes", "⚙️ Gestión de Tareas", "🔁 Tareas Recurrentes", "📦 Exportar / Importar"]
 
 def create_admin_dashboard():
     st.set_page_config(page_title="Administrador de Tareas", page_icon="👨‍💼", layout="wide", initial_sidebar_state="collapsed")
@@ -228,19 +500,37 @@ def create_admin_dashboard():
             st.switch_page("login.py")
         st.stop()
 
+    perf_panel.start("task_manager")
     st.title("Panel de Administración de Tareas")
 
     if st.button("Volver"):
         st.switch_page("pages/dashboard.py")
 
-    # Tabs para separar las secciones
-    tab1, tab2 = st.tabs(["📋 Solicitudes", "⚙️ Gestión de Tareas"])
-    
-    with tab1:
-        show_requests_tab()
-    
-    with tab2:
-        show_management_tab()
+    # Solo se dibuja y consulta la sección activa; los filtros de gestión
+    # conservan su valor al cambiar de sección
+    section = st.radio(
+        "Sección",
+        SECTIONS,
+        horizontal=True,
+        label_visibility="collapsed",
+        key="admin_section"
+    )
+
+    if section == SECTIONS[0]:
+        show_requests_tab(utils.get_pending_admin_tasks())
+    elif section == SECTIONS[1]:
+        search_text, page_query = show_management_filters()
+        if search_text:
+            # Con búsqueda, los resultados van por relevancia en lugar de por fecha
+            show_management_tab(*utils.search_tasks(search_text, **page_query))
+        else:
+            show_management_tab(*utils.get_filtered_tasks_page(**page_query))
+    elif section == SECTIONS[2]:
+        show_recurring_tab(utils.get_recurring_tasks())
+    else:
+        show_io_tab()
+
+    perf_panel.show()
 
 if __name__ == "__main__":
     create_admin_dashboard()
\ No newline at end of file
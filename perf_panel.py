@@ -0,0 +1,109 @@
+"""
+Panel de rendimiento opcional en la barra lateral. Muestra, por rerun y por
+sesión, cuántas veces se llamó cada función de datos de utils, cuánto tardó,
+cuántos round-trips hizo a Mongo y cuántos documentos y bytes recibió, además
+de los aciertos de la caché de lecturas del proceso.
+
+Uso desde una página:
+
+    perf_panel.start("dashboard")      # al principio del rerun
+    ...
+    perf_panel.show()                  # al final, después de todas las consultas
+
+Mientras el interruptor está apagado no se mide nada.
+"""
+import json
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+import utils
+
+PANEL_KEY = "perf_panel"
+
+
+def _session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else "local"
+
+
+def start(label, fragment=False):
+    """
+    Empieza a medir el rerun si el panel está activado en esta sesión. Dentro de
+    un fragmento pasar fragment=True: solo abre un rerun propio cuando el
+    fragmento se ejecuta solo, si no sus consultas cuentan en el de la página
+    """
+    if not st.session_state.get(PANEL_KEY):
+        utils.stop_perf_rerun()
+        return
+    if fragment:
+        ctx = get_script_run_ctx()
+        if not (ctx and ctx.fragment_ids_this_run):
+            return
+    utils.start_perf_rerun(_session_id(), label)
+
+
+def _table(functions):
+    rows = [
+        {
+            "función": name,
+            "llamadas": c["llamadas"],
+            "ms": round(c["segundos"] * 1000, 1),
+            "round-trips": c["round_trips"],
+            "ms mongo": round(c["segundos_mongo"] * 1000, 1),
+            "documentos": c["documentos"],
+            "KB": round(c["bytes"] / 1024, 1),
+        }
+        for name, c in sorted(functions.items())
+    ]
+    return pd.DataFrame(rows)
+
+
+def show():
+    """Dibuja el interruptor y, si está activado, las mediciones de la sesión"""
+    with st.sidebar:
+        if not st.toggle("Panel de rendimiento", key=PANEL_KEY):
+            return
+
+        session_id = _session_id()
+        stats = utils.get_perf_stats(session_id)
+        session = stats["sesiones"].get(session_id)
+        if not session or not session["reruns"]:
+            st.caption("Las mediciones empiezan en el próximo rerun")
+            return
+
+        rerun = session["reruns"][-1]
+        st.write(f"**Último rerun:** {rerun['etiqueta']}")
+        if rerun["funciones"]:
+            st.dataframe(_table(rerun["funciones"]), hide_index=True)
+        else:
+            st.caption("Sin consultas")
+
+        st.write(f"**Sesión** ({len(session['reruns'])} reruns recientes)")
+        st.dataframe(_table(session["funciones"]), hide_index=True)
+
+        # La caché es común a todas las sesiones del proceso
+        cache = utils.get_cache_stats()
+        reads = cache["hits"] + cache["misses"] + cache["coalesced"]
+        st.write("**Caché del proceso**")
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Aciertos", cache["hits"])
+        col2.metric("Fallos", cache["misses"])
+        col3.metric("Coalescidas", cache["coalesced"])
+        st.caption(
+            f"{(cache['hits'] + cache['coalesced']) / reads:.0%} de las lecturas sin consulta propia · "
+            f"{cache['size']} claves" if reads else f"Sin lecturas · {cache['size']} claves"
+        )
+
+        st.download_button(
+            "Exportar JSON",
+            json.dumps(dict(stats, cache=cache), indent=2),
+            file_name="rendimiento.json",
+            mime="application/json"
+        )
+        st.download_button(
+            "Exportar Prometheus",
+            utils.get_perf_prometheus(session_id),
+            file_name="rendimiento.prom",
+            mime="text/plain"
+        )
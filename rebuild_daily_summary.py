@@ -0,0 +1,18 @@
+import sys
+from datetime import datetime
+import utils
+
+# Uso: python rebuild_daily_summary.py [AAAA-MM-DD AAAA-MM-DD]
+# Recalcula task_daily_summary desde tasks, completo o entre dos fechas (la
+# segunda excluida).
+if __name__ == "__main__":
+    if len(sys.argv) not in (1, 3):
+        print("Uso: python rebuild_daily_summary.py [AAAA-MM-DD AAAA-MM-DD]")
+        sys.exit(2)
+
+    start = end = None
+    if len(sys.argv) == 3:
+        start, end = (datetime.strptime(value, "%Y-%m-%d") for value in sys.argv[1:])
+
+    utils.rebuild_daily_summary(start, end)
+    print("Resumen diario reconstruido")
@@ -0,0 +1,250 @@
+"""
+Exportación e importación de tareas en CSV o Parquet.
+
+La exportación recorre un cursor con los filtros de get_filtered_tasks y
+escribe lotes de tamaño fijo, sin cargar todas las tareas en memoria. La
+importación lee el archivo por lotes, valida cada fila e inserta las válidas
+con insert_many por bloques; devuelve los errores con su número de fila.
+Los comentarios no se exportan.
+
+Uso:
+
+    python task_io.py export tareas.csv --estado pendiente --usuario Juan --desde 2024-01-01 --hasta 2024-12-31
+    python task_io.py import tareas.parquet
+
+import termina con código 1 si alguna fila no se pudo importar.
+"""
+import argparse
+import sys
+from datetime import date, datetime
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+from bson import ObjectId
+from bson.errors import InvalidId
+
+import utils
+
+BATCH_SIZE = 1000
+FORMATS = ("csv", "parquet")
+USERS = ["Juan", "Jose", "Los dos"]
+STATES = ["pendiente", "completada", "extension_solicitada", "imposible"]
+
+SCHEMA = pa.schema([
+    ("_id", pa.string()),
+    ("nombre", pa.string()),
+    ("descripcion", pa.string()),
+    ("fecha_hora", pa.timestamp("ms")),
+    ("asignado_a", pa.string()),
+    ("estado", pa.string()),
+    ("fecha_creacion", pa.timestamp("ms")),
+    ("ultima_actualizacion", pa.timestamp("ms")),
+    ("num_comentarios", pa.int64()),
+    # solicitud_extension y razon_imposible, aplanados para que quepan en CSV
+    ("razon_extension", pa.string()),
+    ("fecha_solicitud_extension", pa.timestamp("ms")),
+    ("razon_imposible", pa.string()),
+])
+
+
+def format_for(path, format=None):
+    """El formato indicado o, si no se indica, el de la extensión del archivo"""
+    format = format or str(path).rsplit(".", 1)[-1].lower()
+    if format not in FORMATS:
+        raise ValueError(f"Formato no soportado: {format}")
+    return format
+
+
+def _record_batch(tasks):
+    columns = {name: [task.get(name) for task in tasks] for name in SCHEMA.names}
+    columns["_id"] = [str(task_id) for task_id in columns["_id"]]
+    extensions = [task.get("solicitud_extension") or {} for task in tasks]
+    columns["razon_extension"] = [extension.get("razon") for extension in extensions]
+    columns["fecha_solicitud_extension"] = [extension.get("fecha_solicitud") for extension in extensions]
+    return pa.RecordBatch.from_pydict(columns, schema=SCHEMA)
+
+
+def export_tasks(output, format="csv", batch_size=BATCH_SIZE, **filters):
+    """
+    Escribe en output (ruta o archivo binario) las tareas que cumplen filters
+    (estados, usuarios, fecha_inicio, fecha_fin). Devuelve cuántas exportó
+    """
+    if format == "csv":
+        writer = pacsv.CSVWriter(output, SCHEMA)
+    else:
+        writer = pq.ParquetWriter(output, SCHEMA)
+
+    total = 0
+    batch = []
+    try:
+        for task in utils.iter_filtered_tasks(batch_size=batch_size, **filters):
+            batch.append(task)
+            if len(batch) == batch_size:
+                writer.write_batch(_record_batch(batch))
+                total += len(batch)
+                batch = []
+        if batch:
+            writer.write_batch(_record_batch(batch))
+            total += len(batch)
+    finally:
+        writer.close()
+    return total
+
+
+def _read_batches(source, format, batch_size):
+    if format == "csv":
+        # Todo se lee como texto para validar cada fila con un mensaje propio
+        reader = pacsv.open_csv(
+            source,
+            convert_options=pacsv.ConvertOptions(
+                column_types={name: pa.string() for name in SCHEMA.names},
+                strings_can_be_null=True
+            )
+        )
+        yield from reader
+    else:
+        yield from pq.ParquetFile(source).iter_batches(batch_size=batch_size)
+
+
+def _parse_datetime(value):
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    return datetime.fromisoformat(str(value).strip()).replace(tzinfo=None)
+
+
+def validate_row(row):
+    """Convierte una fila en un documento de tarea o lanza ValueError con el motivo"""
+    nombre = (row.get("nombre") or "").strip()
+    if not nombre:
+        raise ValueError("Falta el nombre")
+
+    if row.get("fecha_hora") is None:
+        raise ValueError("Falta fecha_hora")
+    try:
+        fecha_hora = _parse_datetime(row["fecha_hora"])
+    except ValueError:
+        raise ValueError(f"fecha_hora inválida: {row['fecha_hora']}")
+
+    asignado_a = row.get("asignado_a")
+    if asignado_a not in USERS:
+        raise ValueError(f"asignado_a debe ser uno de {', '.join(USERS)}")
+
+    estado = row.get("estado") or "pendiente"
+    if estado not in STATES:
+        raise ValueError(f"estado inválido: {estado}")
+
+    document = utils.new_task_document(nombre, row.get("descripcion") or "", fecha_hora, asignado_a, estado)
+
+    # Las solicitudes del panel de administración necesitan la razón, igual que
+    # al marcarlas desde el calendario
+    if estado == "extension_solicitada":
+        if not (row.get("razon_extension") or "").strip():
+            raise ValueError("Falta razon_extension para una tarea con extensión solicitada")
+        fecha_solicitud = datetime.now()
+        if row.get("fecha_solicitud_extension"):
+            try:
+                fecha_solicitud = _parse_datetime(row["fecha_solicitud_extension"])
+            except ValueError:
+                raise ValueError(f"fecha_solicitud_extension inválida: {row['fecha_solicitud_extension']}")
+        document["solicitud_extension"] = {
+            "fecha_solicitud": fecha_solicitud,
+            "razon": row["razon_extension"].strip(),
+            "estado": "pendiente"
+        }
+        document["num_extensiones"] = 1
+    elif estado == "imposible":
+        if not (row.get("razon_imposible") or "").strip():
+            raise ValueError("Falta razon_imposible para una tarea imposible")
+        document["razon_imposible"] = row["razon_imposible"].strip()
+        document["num_imposibles"] = 1
+
+    if row.get("fecha_creacion"):
+        try:
+            document["fecha_creacion"] = _parse_datetime(row["fecha_creacion"])
+        except ValueError:
+            raise ValueError(f"fecha_creacion inválida: {row['fecha_creacion']}")
+    # Con _id una copia de seguridad se puede restaurar sin duplicar tareas
+    if row.get("_id"):
+        try:
+            document["_id"] = ObjectId(row["_id"])
+        except (InvalidId, TypeError):
+            raise ValueError(f"_id inválido: {row['_id']}")
+    return document
+
+
+def import_tasks(source, format="csv", batch_size=BATCH_SIZE):
+    """
+    Importa las tareas de source (ruta o archivo binario). Devuelve
+    {"insertadas", "errores"}, donde errores es una lista de {"fila", "error"}
+    y la fila 1 es la primera después del encabezado
+    """
+    inserted = 0
+    errors = []
+    row_number = 0
+    for batch in _read_batches(source, format, batch_size):
+        for offset in range(0, batch.num_rows, batch_size):
+            documents = []
+            rows = []
+            for row in batch.slice(offset, batch_size).to_pylist():
+                row_number += 1
+                try:
+                    documents.append(validate_row(row))
+                    rows.append(row_number)
+                except ValueError as e:
+                    errors.append({"fila": row_number, "error": str(e)})
+
+            failed = utils.insert_tasks(documents)
+            inserted += len(documents) - len(failed)
+            errors.extend({"fila": rows[index], "error": error} for index, error in failed.items())
+
+    errors.sort(key=lambda error: error["fila"])
+    return {"insertadas": inserted, "errores": errors}
+
+
+def _date(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python task_io.py", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="exporta tareas a CSV o Parquet")
+    export.add_argument("output")
+    export.add_argument("--formato", choices=FORMATS, help="por defecto, el de la extensión")
+    export.add_argument("--estado", action="append", choices=STATES)
+    export.add_argument("--usuario", action="append", choices=USERS)
+    export.add_argument("--desde", type=_date)
+    export.add_argument("--hasta", type=_date)
+
+    load = commands.add_parser("import", help="importa tareas desde CSV o Parquet")
+    load.add_argument("source")
+    load.add_argument("--formato", choices=FORMATS, help="por defecto, el de la extensión")
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        total = export_tasks(
+            args.output,
+            format_for(args.output, args.formato),
+            estados=args.estado,
+            usuarios=args.usuario,
+            fecha_inicio=args.desde,
+            fecha_fin=args.hasta
+        )
+        print(f"{total} tareas exportadas a {args.output}")
+
+    elif args.command == "import":
+        report = import_tasks(args.source, format_for(args.source, args.formato))
+        print(f"{report['insertadas']} tareas importadas")
+        for error in report["errores"]:
+            print(f"Fila {error['fila']}: {error['error']}")
+        if report["errores"]:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+"""
+Las pruebas usan mongomock en lugar de un mongod: set_client inyecta el
+cliente en memoria y con él no hace falta secrets.toml.
+"""
+import mongomock
+import pytest
+
+import utils
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "_config", {})
+    monkeypatch.setattr(utils, "_cache_stats", {"hits": 0, "misses": 0, "coalesced": 0})
+    monkeypatch.setattr(utils, "WRITE_BEHIND_SPILL_PATH", str(tmp_path / "write_behind.jsonl"))
+    utils.set_client(mongomock.MongoClient())
+    yield utils.connect_to_mongo("users")
+    utils.set_client(None)
+    with utils._wb_condition:
+        utils._wb_queue.clear()
+        utils._wb_pending.clear()
+        utils._wb_failed.clear()
@@ -0,0 +1,135 @@
+import threading
+import time
+from datetime import datetime
+
+import utils
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timeout"
+        time.sleep(0.005)
+
+
+class BlockingLoader:
+    """Loader que no termina hasta que se llama release()"""
+
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+        self.started = threading.Event()
+        self._release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        assert self._release.wait(5)
+        return self.value
+
+    def release(self):
+        self._release.set()
+
+
+def load_in_thread(key, loader, results):
+    thread = threading.Thread(target=lambda: results.append(utils._cached(key, loader)))
+    thread.start()
+    return thread
+
+
+def test_concurrent_misses_share_one_load(db):
+    key = ("month", 2026, 10)
+    loader = BlockingLoader(["tarea"])
+    results = []
+
+    leader = load_in_thread(key, loader, results)
+    assert loader.started.wait(5)
+    followers = [load_in_thread(key, loader, results) for _ in range(4)]
+    wait_until(lambda: utils.get_cache_stats()["coalesced"] == 4)
+    loader.release()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert loader.calls == 1
+    assert results == [["tarea"]] * 5
+    assert utils.get_cache_stats()["misses"] == 1
+    # Ya en caché: otra llamada no consulta
+    assert utils._cached(key, loader) == ["tarea"]
+    assert loader.calls == 1
+
+
+def test_followers_get_the_leader_error(db):
+    key = ("month", 2026, 10)
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("sin servidor")
+
+    errors = []
+
+    def call():
+        try:
+            utils._cached(key, failing)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call)]
+    threads[0].start()
+    assert started.wait(5)
+    threads.append(threading.Thread(target=call))
+    threads[1].start()
+    wait_until(lambda: utils.get_cache_stats()["coalesced"] == 1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert errors == ["sin servidor"] * 2
+    assert utils.get_cache_stats()["size"] == 0
+
+
+def test_invalidation_during_load_is_not_cached(db):
+    key = ("month", 2026, 10)
+    loader = BlockingLoader(["versión vieja"])
+    results = []
+
+    thread = load_in_thread(key, loader, results)
+    assert loader.started.wait(5)
+    # Una escritura de una tarea de ese mes llega mientras se consulta
+    utils.invalidate_tasks({"_id": "t", "fecha_hora": datetime(2026, 10, 5), "estado": "pendiente"})
+    loader.release()
+    thread.join(5)
+
+    assert results == [["versión vieja"]]
+    assert key not in utils._get_cache()
+    assert utils._cached(key, lambda: ["versión nueva"]) == ["versión nueva"]
+
+
+def test_invalidation_of_other_month_keeps_result(db):
+    key = ("month", 2026, 10)
+    loader = BlockingLoader(["tarea"])
+    results = []
+
+    thread = load_in_thread(key, loader, results)
+    assert loader.started.wait(5)
+    utils.invalidate_tasks({"_id": "t", "fecha_hora": datetime(2026, 11, 5), "estado": "pendiente"})
+    loader.release()
+    thread.join(5)
+
+    assert utils._get_cache()[key] == ["tarea"]
+
+
+def test_clear_cache_during_load_is_not_cached(db):
+    key = ("summary", 2026, 10)
+    loader = BlockingLoader({"resumen": 1})
+    results = []
+
+    thread = load_in_thread(key, loader, results)
+    assert loader.started.wait(5)
+    utils.clear_cache()
+    loader.release()
+    thread.join(5)
+
+    assert key not in utils._get_cache()
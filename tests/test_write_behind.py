@@ -0,0 +1,136 @@
+from datetime import datetime
+
+from bson import json_util
+
+import utils
+
+VERSION = datetime(2026, 1, 1)
+
+
+def new_task(db):
+    return db.tasks.insert_one({
+        "nombre": "Tarea",
+        "fecha_hora": datetime(2026, 10, 20, 9),
+        "estado": "pendiente",
+        "asignado_a": "Juan",
+        "ultima_actualizacion": VERSION,
+        "num_comentarios": 0,
+        "comentarios_recientes": [],
+    }).inserted_id
+
+
+def comment_texts(db, task_id):
+    task = db.tasks.find_one({"_id": task_id})
+    return task["num_comentarios"], [comment["texto"] for comment in task["comentarios_recientes"]]
+
+
+def write_spill(operations):
+    """Deja el archivo como lo encontraría un proceso que murió con esa cola"""
+    with open(utils.WRITE_BEHIND_SPILL_PATH, "w", encoding="utf-8") as spill:
+        for operation in operations:
+            spill.write(json_util.dumps(operation) + "\n")
+
+
+def queue_comments(task_id, *texts):
+    """Encola un comentario por texto y devuelve las operaciones nuevas"""
+    queued = len(utils._wb_queue)
+    for text in texts:
+        assert utils._enqueue_update(task_id, {}, comment=text).status == "queued"
+    return utils._wb_queue[queued:]
+
+
+def test_flush_applies_queued_comments_once(db):
+    task_id = new_task(db)
+    batch = queue_comments(task_id, "uno", "dos")
+
+    utils._flush_write_behind(batch)
+    # Reintentar el mismo lote (por ejemplo tras perder la respuesta) no suma otra vez
+    utils._flush_write_behind(batch)
+
+    assert comment_texts(db, task_id) == (2, ["uno", "dos"])
+    assert db.comments.count_documents({"task_id": task_id}) == 2
+    assert db.operaciones_aplicadas.count_documents({}) == 2
+    assert utils._wb_queue == []
+
+
+def test_replay_skips_recorded_operations(db):
+    task_id = new_task(db)
+    operations = queue_comments(task_id, "uno", "dos", "tres")
+    utils._flush_write_behind(operations[:2])
+    # El proceso murió antes de reescribir el archivo
+    write_spill(operations)
+
+    replay = utils._spill_load()
+
+    assert [operation["comment"]["texto"] for operation in replay] == ["tres"]
+    utils._flush_write_behind(replay)
+    assert comment_texts(db, task_id) == (3, ["uno", "dos", "tres"])
+
+
+def test_replay_after_dying_before_recording_operations(db):
+    task_id = new_task(db)
+    other_id = new_task(db)
+    operations = queue_comments(task_id, "uno", "dos") + queue_comments(other_id, "otra")
+    operations += queue_comments(task_id, "tres")
+    utils._flush_write_behind(operations[:3])
+    # La tarea se actualizó pero las operaciones no quedaron registradas
+    db.operaciones_aplicadas.delete_many({})
+    write_spill(operations)
+
+    replay = utils._spill_load()
+
+    assert [operation["comment"]["texto"] for operation in replay] == ["tres"]
+    utils._flush_write_behind(replay)
+    assert comment_texts(db, task_id) == (3, ["uno", "dos", "tres"])
+    assert comment_texts(db, other_id) == (1, ["otra"])
+
+
+def test_replay_of_unapplied_batch(db):
+    task_id = new_task(db)
+    operations = queue_comments(task_id, "uno", "dos")
+    write_spill(operations)
+
+    replay = utils._spill_load()
+
+    assert [operation["_id"] for operation in replay] == [operation["_id"] for operation in operations]
+    utils._flush_write_behind(replay)
+    assert comment_texts(db, task_id) == (2, ["uno", "dos"])
+
+
+def test_stale_expected_is_reported_as_conflict(db):
+    task_id = new_task(db)
+    db.tasks.update_one({"_id": task_id}, {"$set": {"ultima_actualizacion": datetime(2026, 2, 1)}})
+    utils._enqueue_update(task_id, {}, comment="tarde", expected=VERSION)
+
+    utils._flush_write_behind(list(utils._wb_queue))
+
+    assert comment_texts(db, task_id) == (0, [])
+    assert db.comments.count_documents({}) == 0
+    assert [failure["estado"] for failure in utils.get_write_behind_stats()["fallidas"]] == ["conflict"]
+
+
+def test_queued_version_chains_expected(db):
+    task_id = new_task(db)
+    utils._enqueue_update(task_id, {}, comment="uno", expected=VERSION)
+    # La misma sesión ve su cambio en cola y vuelve a comentar con esa versión
+    seen = utils._pending_view(db.tasks.find_one({"_id": task_id}))
+    utils._enqueue_update(task_id, {}, comment="dos", expected=seen["ultima_actualizacion"])
+    # Otra sesión con la versión que había antes choca
+    utils._enqueue_update(task_id, {}, comment="otra sesión", expected=VERSION)
+
+    utils._flush_write_behind(list(utils._wb_queue))
+
+    assert comment_texts(db, task_id) == (2, ["uno", "dos"])
+    failures = utils.get_write_behind_stats()["fallidas"]
+    assert [failure["estado"] for failure in failures] == ["conflict"]
+
+
+def test_deleted_task_is_reported_as_not_found(db):
+    task_id = new_task(db)
+    batch = queue_comments(task_id, "uno")
+    db.tasks.delete_one({"_id": task_id})
+
+    utils._flush_write_behind(batch)
+
+    assert db.comments.count_documents({}) == 0
+    assert [failure["estado"] for failure in utils.get_write_behind_stats()["fallidas"]] == ["not_found"]
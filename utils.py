@@ -1,17 +1,1417 @@
-from pymongo import MongoClient
+from pymongo import ASCENDING, TEXT, IndexModel, MongoClient, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError, OperationFailure, PyMongoError
+from dateutil.rrule import rrulestr
+from cachetools import LRUCache, TTLCache
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+from collections import deque
+from dataclasses import dataclass
+import atexit
+import contextvars
+import functools
+import hashlib
+import os
+import threading
+import time
 import toml
 from datetime import datetime, timedelta
-from bson import ObjectId
+from bson import ObjectId, encode as bson_encode, json_util
+
+SECRETS_PATH = ".streamlit/secrets.toml"
+
+# Opciones de MongoClient que se pueden ajustar desde [mongo] en secrets.toml
+CLIENT_OPTIONS = {
+    "max_pool_size": ("maxPoolSize", 50),
+    "min_pool_size": ("minPoolSize", 0),
+    "max_idle_time_ms": ("maxIdleTimeMS", 60000),
+    "server_selection_timeout_ms": ("serverSelectionTimeoutMS", 5000),
+    "connect_timeout_ms": ("connectTimeoutMS", 5000),
+    "socket_timeout_ms": ("socketTimeoutMS", 20000),
+}
+
+_config = None
+_client = None
+_client_lock = threading.Lock()
+
+
+def load_config():
+    """
+    Lee la configuración de Mongo una sola vez por proceso. Sin secrets.toml se
+    usan los valores por defecto si hay MONGO_URI o un cliente inyectado con
+    set_client
+    """
+    global _config
+    if _config is None:
+        try:
+            _config = toml.load(SECRETS_PATH)["mongo"]
+        except FileNotFoundError:
+            if not os.environ.get("MONGO_URI") and _client is None:
+                raise
+            _config = {}
+    return _config
+
+
+def mongo_uri():
+    # MONGO_URI permite apuntar a un mongod local sin tocar secrets.toml
+    return os.environ.get("MONGO_URI") or load_config()["uri"]
+
+
+def get_client():
+    """Devuelve el MongoClient compartido por todo el proceso, creándolo si hace falta"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                config = load_config()
+                uri = mongo_uri()
+                options = {
+                    option: config.get(key, default)
+                    for key, (option, default) in CLIENT_OPTIONS.items()
+                }
+                client = MongoClient(uri, event_listeners=[_perf_listener], **options)
+                ensure_indexes(client["users"])
+                _migrate_comments(client["users"])
+                _ensure_daily_summary(client["users"])
+                _client = client
+    return _client
+
+
+def set_client(client):
+    """
+    Reemplaza el cliente compartido (por ejemplo por uno de un mongod local
+    o uno en memoria para pruebas) y vacía la caché de lecturas. Devuelve el
+    cliente anterior sin cerrarlo.
+    """
+    global _client
+    with _client_lock:
+        previous, _client = _client, client
+    # Lo cacheado salió de la base anterior
+    clear_cache()
+    with _cache_lock:
+        _local_writes.clear()
+    return previous
+
+
+def close_mongo():
+    """Cierra el cliente compartido; la siguiente llamada abre uno nuevo"""
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        client.close()
+
+
+def _shutdown():
+    stop_change_watcher()
+    stop_write_behind()
+    close_mongo()
+
+
+atexit.register(_shutdown)
 
 
 def connect_to_mongo(db_name=None):
-    config = toml.load(".streamlit/secrets.toml")
-    client = MongoClient(config["mongo"]["uri"])
+    client = get_client()
     if db_name:
         return client[db_name]
     else:
         return client
-    
+
+
+# Instrumentación opcional: cuenta llamadas, latencia, round-trips, documentos
+# y bytes de cada función de datos, agrupados por rerun y por sesión. Solo se
+# mide lo que corre dentro de un rerun iniciado con start_perf_rerun; fuera de
+# eso cada llamada cuesta una lectura de ContextVar
+PERF_RERUNS = 20
+PERF_SESSIONS = 50
+
+_perf_rerun = contextvars.ContextVar("perf_rerun", default=None)
+_perf_function = contextvars.ContextVar("perf_function", default=None)
+_perf_lock = threading.Lock()
+_perf_sessions = LRUCache(maxsize=PERF_SESSIONS)
+
+
+def _perf_counters():
+    return {"llamadas": 0, "segundos": 0.0, "round_trips": 0,
+            "segundos_mongo": 0.0, "documentos": 0, "bytes": 0}
+
+
+def start_perf_rerun(session_id, label):
+    """
+    Empieza a medir un rerun de la sesión. Las funciones de datos llamadas desde
+    este contexto, también a través de async_utils, se acumulan en él
+    """
+    rerun = {"etiqueta": label, "inicio": datetime.now(), "funciones": {}}
+    with _perf_lock:
+        session = _perf_sessions.get(session_id)
+        if session is None:
+            session = {"reruns": deque(maxlen=PERF_RERUNS), "funciones": {}}
+            _perf_sessions[session_id] = session
+        session["reruns"].append(rerun)
+    _perf_rerun.set((rerun, session))
+    return rerun
+
+
+def stop_perf_rerun():
+    """Deja de medir en el contexto actual"""
+    _perf_rerun.set(None)
+
+
+def _perf_record(target, name, **values):
+    with _perf_lock:
+        for owner in target:
+            counters = owner["funciones"].setdefault(name, _perf_counters())
+            for field, value in values.items():
+                counters[field] += value
+
+
+def instrumented(func):
+    """
+    Mide una función de datos pública. Las llamadas anidadas (por ejemplo
+    mark_as_completed -> resolve_task_id) se cuentan en la más externa
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        target = _perf_rerun.get()
+        if target is None or _perf_function.get() is not None:
+            return func(*args, **kwargs)
+        token = _perf_function.set(name)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _perf_function.reset(token)
+            _perf_record(target, name, llamadas=1, segundos=time.perf_counter() - start)
+    return wrapper
+
+
+def _reply_documents(reply):
+    cursor = reply.get("cursor")
+    if cursor is not None:
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", ())))
+    if "value" in reply:
+        return int(reply["value"] is not None)
+    return 0
+
+
+class _PerfListener(monitoring.CommandListener):
+    """Atribuye cada comando a la función de datos que lo lanzó"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        target = _perf_rerun.get()
+        if target is None:
+            return
+        _perf_record(
+            target, _perf_function.get() or event.command_name,
+            round_trips=1,
+            segundos_mongo=event.duration_micros / 1e6,
+            documentos=_reply_documents(event.reply),
+            bytes=len(bson_encode(event.reply))
+        )
+
+    def failed(self, event):
+        target = _perf_rerun.get()
+        if target is None:
+            return
+        _perf_record(
+            target, _perf_function.get() or event.command_name,
+            round_trips=1, segundos_mongo=event.duration_micros / 1e6
+        )
+
+
+_perf_listener = _PerfListener()
+
+
+def get_perf_stats(session_id=None):
+    """
+    Copia serializable a JSON de las mediciones: totales y últimos reruns de
+    cada sesión, o solo de session_id
+    """
+    with _perf_lock:
+        sessions = {
+            sid: {
+                "funciones": {name: dict(c) for name, c in session["funciones"].items()},
+                "reruns": [
+                    {
+                        "etiqueta": rerun["etiqueta"],
+                        "inicio": rerun["inicio"].isoformat(),
+                        "funciones": {name: dict(c) for name, c in rerun["funciones"].items()},
+                    }
+                    for rerun in session["reruns"]
+                ],
+            }
+            for sid, session in _perf_sessions.items()
+            if session_id is None or sid == session_id
+        }
+    return {"sesiones": sessions}
+
+
+PERF_METRICS = {
+    "llamadas": ("task_calendar_calls_total", "Llamadas a funciones de datos"),
+    "segundos": ("task_calendar_call_seconds_total", "Tiempo total dentro de la función"),
+    "round_trips": ("task_calendar_mongo_round_trips_total", "Comandos enviados a Mongo"),
+    "segundos_mongo": ("task_calendar_mongo_seconds_total", "Tiempo de Mongo según el driver"),
+    "documentos": ("task_calendar_mongo_documents_total", "Documentos devueltos por Mongo"),
+    "bytes": ("task_calendar_mongo_reply_bytes_total", "Bytes BSON de las respuestas"),
+}
+
+# Contadores de get_cache_stats, comunes a todo el proceso
+CACHE_METRICS = {
+    "hits": ("task_calendar_cache_hits_total", "counter", "Lecturas servidas por la caché"),
+    "misses": ("task_calendar_cache_misses_total", "counter", "Lecturas que consultaron Mongo"),
+    "coalesced": ("task_calendar_cache_coalesced_total", "counter", "Lecturas que esperaron una consulta igual en curso"),
+    "size": ("task_calendar_cache_entries", "gauge", "Claves en la caché"),
+}
+
+
+def get_perf_prometheus(session_id=None):
+    """
+    Las mismas mediciones por sesión y función en formato de texto de
+    Prometheus, más los contadores de la caché del proceso
+    """
+    sessions = get_perf_stats(session_id)["sesiones"]
+    lines = []
+    for field, (metric, help_text) in PERF_METRICS.items():
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for sid, session in sessions.items():
+            for name, counters in sorted(session["funciones"].items()):
+                lines.append(f'{metric}{{session="{sid}",function="{name}"}} {counters[field]}')
+    cache = get_cache_stats()
+    for field, (metric, kind, help_text) in CACHE_METRICS.items():
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        lines.append(f"{metric} {cache[field]}")
+    return "\n".join(lines) + "\n"
+
+
+# Índices que necesitan las consultas de este módulo, por colección
+INDEXES = {
+    "tasks": [
+        # get_month_tasks / get_day_tasks: rango de fecha_hora ordenado
+        IndexModel([("fecha_hora", ASCENDING)], name="fecha_hora"),
+        # get_pending_admin_tasks: estado por igualdad, orden por fecha_hora
+        IndexModel([("estado", ASCENDING), ("fecha_hora", ASCENDING)], name="estado_fecha_hora"),
+        # get_filtered_tasks(_page): estado y asignado_a por igualdad, rango y orden
+        # por fecha_hora; _id desempata el orden de las páginas
+        IndexModel(
+            [("estado", ASCENDING), ("asignado_a", ASCENDING), ("fecha_hora", ASCENDING), ("_id", ASCENDING)],
+            name="estado_asignado_fecha_hora_id"
+        ),
+        # _migrate_comments: solo contiene las tareas que aún tienen el arreglo
+        # comentarios, así que revisarlo al arrancar no recorre la colección
+        IndexModel(
+            [("comentarios.fecha", ASCENDING)],
+            name="comentarios_sin_migrar",
+            partialFilterExpression={"comentarios": {"$exists": True}}
+        ),
+        # Sondeo de cambios cuando no hay change streams
+        IndexModel([("ultima_actualizacion", ASCENDING)], name="ultima_actualizacion"),
+        # search_tasks: búsqueda de texto; el nombre pesa más que la descripción
+        IndexModel(
+            [("nombre", TEXT), ("descripcion", TEXT)],
+            name="texto",
+            weights={"nombre": 10, "descripcion": 2},
+            default_language="spanish"
+        ),
+        # Una sola tarea materializada por ocurrencia de una tarea recurrente
+        IndexModel(
+            [("recurrencia_id", ASCENDING), ("fecha_original", ASCENDING)],
+            name="recurrencia_fecha_original",
+            unique=True,
+            partialFilterExpression={"recurrencia_id": {"$exists": True}}
+        ),
+    ],
+    "recurring_tasks": [
+        IndexModel([("dtstart", ASCENDING)], name="dtstart"),
+    ],
+    "deleted_tasks": [
+        # Las marcas de borrado solo se necesitan mientras pueda haber copias que sincronizar
+        IndexModel([("eliminado", ASCENDING)], name="eliminado_ttl", expireAfterSeconds=7 * 24 * 3600),
+    ],
+    "operaciones_aplicadas": [
+        # Escritura diferida: basta con recordar las operaciones mientras puedan
+        # seguir en el archivo local de algún proceso
+        IndexModel([("fecha", ASCENDING)], name="fecha_ttl", expireAfterSeconds=7 * 24 * 3600),
+    ],
+    "comments": [
+        # get_task_comments: comentarios de una tarea del más reciente al más antiguo
+        IndexModel([("task_id", ASCENDING), ("fecha", -1), ("_id", -1)], name="task_fecha_id"),
+        # search_tasks: búsqueda de texto en los comentarios
+        IndexModel([("texto", TEXT)], name="texto", default_language="spanish"),
+    ],
+    "data": [
+        IndexModel([("username", ASCENDING)], name="username"),
+    ],
+}
+
+
+# Índices que reemplazó otro de INDEXES, por colección: solo agregan costo a
+# las escrituras, así que ensure_indexes los elimina
+OBSOLETE_INDEXES = {
+    "tasks": [
+        # Cubierto por estado_asignado_fecha_hora_id, que agrega _id para paginar
+        [("estado", ASCENDING), ("asignado_a", ASCENDING), ("fecha_hora", ASCENDING)],
+    ],
+}
+
+
+def _index_key(key, weights=None):
+    # El servidor puede devolver la dirección como 1.0 en lugar de 1
+    key = [
+        (field, int(direction) if isinstance(direction, float) else direction)
+        for field, direction in key
+    ]
+    # Un índice de texto aparece en el servidor como _fts/_ftsx con los campos
+    # en weights; se comparan sus campos sin importar el orden
+    if weights:
+        key = [(field, direction) for field, direction in key if field not in ("_fts", "_ftsx")]
+        key.extend((field, TEXT) for field in weights)
+    text = sorted(field for field, direction in key if direction == TEXT)
+    return tuple((field, direction) for field, direction in key if direction != TEXT) + tuple((field, TEXT) for field in text)
+
+
+def ensure_indexes(db):
+    """
+    Crea los índices declarados en INDEXES que aún no existen y elimina los de
+    OBSOLETE_INDEXES. Un índice se considera existente si ya hay otro con las
+    mismas claves, sin importar su nombre.
+    """
+    created = []
+    for collection_name, indexes in INDEXES.items():
+        collection = db[collection_name]
+        information = collection.index_information()
+        obsolete = {_index_key(key) for key in OBSOLETE_INDEXES.get(collection_name, [])}
+        for name, info in information.items():
+            if _index_key(info["key"], info.get("weights")) in obsolete:
+                collection.drop_index(name)
+        existing = {
+            _index_key(info["key"], info.get("weights")) for info in information.values()
+        }
+        missing = [
+            index for index in indexes
+            if _index_key(index.document["key"].items()) not in existing
+        ]
+        if missing:
+            created.extend(collection.create_indexes(missing))
+    return created
+
+
+def month_range(year, month):
+    """Devuelve el inicio del mes y el inicio del mes siguiente"""
+    start_date = datetime(year, month, 1)
+    if month == 12:
+        end_date = datetime(year + 1, 1, 1)
+    else:
+        end_date = datetime(year, month + 1, 1)
+    return start_date, end_date
+
+
+def month_query(year, month):
+    start_date, end_date = month_range(year, month)
+    return {"fecha_hora": {"$gte": start_date, "$lt": end_date}}
+
+
+def day_query(year, month, day):
+    start_date = datetime(year, month, day)
+    end_date = start_date + timedelta(days=1)
+    return {"fecha_hora": {"$gte": start_date, "$lt": end_date}}
+
+
+ADMIN_STATES = ["extension_solicitada", "imposible"]
+
+
+def pending_admin_query():
+    return {"estado": {"$in": ADMIN_STATES}}
+
+
+def upcoming_query(usuarios, start, end):
+    query = {"estado": "pendiente", "fecha_hora": {"$gte": start, "$lt": end}}
+    if usuarios:
+        query["asignado_a"] = {"$in": usuarios}
+    return query
+
+
+def filtered_query(estados=None, usuarios=None, fecha_inicio=None, fecha_fin=None):
+    query = {}
+
+    if estados:
+        query["estado"] = {"$in": estados}
+
+    if usuarios:
+        query["asignado_a"] = {"$in": usuarios}
+
+    if fecha_inicio and fecha_fin:
+        query["fecha_hora"] = {
+            "$gte": datetime.combine(fecha_inicio, datetime.min.time()),
+            "$lte": datetime.combine(fecha_fin, datetime.max.time())
+        }
+
+    return query
+
+
+def after_cursor_query(query, cursor):
+    """Añade a query la condición de keyset para empezar después de cursor (fecha_hora, _id)"""
+    if cursor is None:
+        return query
+    fecha_hora, task_id = cursor
+    return {
+        "$and": [
+            query,
+            {"$or": [
+                {"fecha_hora": {"$gt": fecha_hora}},
+                {"fecha_hora": fecha_hora, "_id": {"$gt": task_id}}
+            ]}
+        ]
+    }
+
+
+# Caché de lecturas. Las claves describen la forma de la consulta:
+#   ("month", año, mes), ("summary", año, mes),
+#   ("day", año, mes, día), ("filtered", estados, usuarios, inicio, fin),
+#   ("filtered", estados, usuarios, inicio, fin, cursor, tamaño), ("pending",),
+#   ("comments", task_id, cursor, tamaño), ("recurring",),
+#   ("statistics", inicio, fin), ("search", estados, usuarios, inicio, fin, texto),
+#   ("upcoming", usuarios, horas, intervalo)
+# La caché es del proceso, así que la comparten todas las sesiones de Streamlit.
+# Los valores devueltos se comparten entre llamadas y no deben modificarse.
+CACHE_MAX_SIZE = 256
+CACHE_TTL_SECONDS = 300
+
+# Campos de una tarea que determinan en qué claves de la caché aparece
+CACHE_FIELDS = {"fecha_hora": 1, "estado": 1, "asignado_a": 1}
+
+_cache = None
+_cache_lock = threading.RLock()
+# Consultas en curso por clave, para que los fallos simultáneos esperen a una sola
+_inflight = {}
+_cache_stats = {"hits": 0, "misses": 0, "coalesced": 0}
+# Versión por (año, mes) de los datos en caché, ver get_month_version
+_month_versions = {}
+# Última copia de las tareas reales de cada mes con su marca de sincronización,
+# para recargar un mes con get_task_changes en lugar de traerlo completo
+MONTH_SNAPSHOTS = 24
+_month_snapshots = LRUCache(maxsize=MONTH_SNAPSHOTS)
+
+
+class _Flight:
+    """Consulta en curso para una clave de la caché"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        # Se marca si una escritura invalida la clave mientras se consulta
+        self.stale = False
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = load_config()
+                _cache = TTLCache(
+                    maxsize=config.get("cache_max_size", CACHE_MAX_SIZE),
+                    ttl=config.get("cache_ttl_seconds", CACHE_TTL_SECONDS)
+                )
+    return _cache
+
+
+def _cached(key, loader):
+    """
+    Devuelve el valor de la caché para key o lo calcula con loader(). Si otra
+    sesión ya está calculando la misma clave, espera su resultado en lugar de
+    repetir la consulta
+    """
+    cache = _get_cache()
+    with _cache_lock:
+        if key in cache:
+            _cache_stats["hits"] += 1
+            return cache[key]
+        flight = _inflight.get(key)
+        if flight is None:
+            flight = _inflight[key] = _Flight()
+            _cache_stats["misses"] += 1
+            leader = True
+        else:
+            _cache_stats["coalesced"] += 1
+            leader = False
+
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    try:
+        flight.value = loader()
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _cache_lock:
+            if flight.error is None and not flight.stale:
+                cache[key] = flight.value
+            _inflight.pop(key, None)
+        flight.done.set()
+    return flight.value
+
+
+def get_cache_stats():
+    """Devuelve los contadores de aciertos, fallos y consultas coalescidas de la caché"""
+    with _cache_lock:
+        stats = dict(_cache_stats)
+        stats["size"] = len(_get_cache())
+        stats["inflight"] = len(_inflight)
+    return stats
+
+
+def clear_cache():
+    """Vacía la caché de lecturas"""
+    with _cache_lock:
+        _get_cache().clear()
+        _month_snapshots.clear()
+        for flight in _inflight.values():
+            flight.stale = True
+
+
+def _key_affected(key, task):
+    """Indica si la tarea (con CACHE_FIELDS) aparece en el resultado de la clave"""
+    kind = key[0]
+    fecha_hora = task.get("fecha_hora")
+
+    if kind == "recurring":
+        return False
+    if kind == "comments":
+        return key[1] == str(task["_id"])
+    if kind == "pending":
+        return task.get("estado") in ADMIN_STATES
+    if kind == "upcoming":
+        return task.get("estado") == "pendiente" and (not key[1] or task.get("asignado_a") in key[1])
+    if not isinstance(fecha_hora, datetime):
+        return False
+    if kind in ("month", "summary"):
+        return (fecha_hora.year, fecha_hora.month) == key[1:3]
+    if kind == "day":
+        return (fecha_hora.year, fecha_hora.month, fecha_hora.day) == key[1:4]
+    if kind in ("filtered", "search"):
+        # Una búsqueda se invalida con cualquier cambio dentro de sus filtros,
+        # porque el cambio puede tocar el texto o los comentarios
+        estados, usuarios, fecha_inicio, fecha_fin = key[1:5]
+        if estados and task.get("estado") not in estados:
+            return False
+        if usuarios and task.get("asignado_a") not in usuarios:
+            return False
+        if fecha_inicio and fecha_fin:
+            return fecha_inicio <= fecha_hora.date() <= fecha_fin
+        return True
+    if kind == "statistics":
+        return key[1] <= fecha_hora.date() <= key[2]
+    return True
+
+
+def invalidate_tasks(*tasks):
+    """
+    Elimina de la caché las claves en las que aparece alguna de las tareas.
+    Para una modificación se pasan la versión anterior y la nueva.
+    """
+    tasks = [task for task in tasks if task]
+    with _cache_lock:
+        cache = _get_cache()
+        for key in list(cache.keys()):
+            if any(_key_affected(key, task) for task in tasks):
+                cache.pop(key, None)
+        for key, flight in _inflight.items():
+            if any(_key_affected(key, task) for task in tasks):
+                flight.stale = True
+
+
+# Cantidad de comentarios recientes que se guardan dentro de la tarea
+RECENT_COMMENTS = 3
+
+
+def _with_comment(update, comment_doc):
+    """Agrega a update el contador y los comentarios recientes para comment_doc"""
+    update = dict(update)
+    update["$inc"] = dict(update.get("$inc", {}), num_comentarios=1)
+    update["$push"] = dict(update.get("$push", {}), comentarios_recientes={
+        "$each": [comment_doc],
+        "$slice": -RECENT_COMMENTS
+    })
+    return update
+
+
+def invalidate_kinds(*kinds):
+    """Elimina de la caché todas las claves de los tipos indicados"""
+    with _cache_lock:
+        cache = _get_cache()
+        for key in list(cache.keys()):
+            if key[0] in kinds:
+                cache.pop(key, None)
+        for key, flight in _inflight.items():
+            if key[0] in kinds:
+                flight.stale = True
+
+
+def get_month_version(year, month):
+    """Contador que aumenta cada vez que el watcher aplica un cambio en el mes"""
+    with _cache_lock:
+        return _month_versions.get((year, month), 0)
+
+
+def _bump_month_version(task):
+    fecha_hora = task.get("fecha_hora") if task else None
+    if isinstance(fecha_hora, datetime):
+        key = (fecha_hora.year, fecha_hora.month)
+        _month_versions[key] = _month_versions.get(key, 0) + 1
+
+
+def _list_view(task):
+    """Convierte un documento completo de tarea a la forma de TASK_LIST_PROJECTION"""
+    view = {field: task[field] for field in TASK_LIST_PROJECTION if field in task}
+    view["_id"] = task["_id"]
+    return view
+
+
+# Últimas escrituras de este proceso, task_id -> ultima_actualizacion que
+# dejaron (_DELETED si la eliminaron). Su invalidación ya se hizo al escribir,
+# así que el watcher ignora el evento que le llega por ellas
+LOCAL_WRITES_KEPT = 1000
+_DELETED = object()
+_local_writes = {}
+
+
+def _remember_writes(*writes):
+    """Registra pares (task_id, ultima_actualizacion) escritos por este proceso"""
+    with _cache_lock:
+        for task_id, stamp in writes:
+            _local_writes.pop(task_id, None)
+            _local_writes[task_id] = stamp
+        while len(_local_writes) > LOCAL_WRITES_KEPT:
+            _local_writes.pop(next(iter(_local_writes)))
+
+
+def apply_task_change(task_id, task):
+    """
+    Lleva a la caché el cambio de una tarea hecho fuera de este proceso. task es
+    la versión nueva en forma de lista (None si se eliminó). Las listas de mes y
+    de día en caché se corrigen en su lugar; las demás claves afectadas se eliminan.
+    Los cambios que escribió este mismo proceso se ignoran
+    """
+    stamp = _DELETED if task is None else task.get("ultima_actualizacion")
+    with _cache_lock:
+        if stamp is not None and _local_writes.get(task_id) == stamp:
+            return
+
+    if task is not None and task.get("recurrencia_id"):
+        # Una ocurrencia materializada cambia también las ocurrencias virtuales
+        invalidate_kinds("recurring", "month", "day", "summary", "upcoming")
+        invalidate_tasks(task)
+        return
+
+    with _cache_lock:
+        cache = _get_cache()
+        entries = [(key, cache.get(key)) for key in list(cache.keys())]
+
+        # La versión anterior, si alguna lista en caché la contiene
+        old = None
+        for key, value in entries:
+            if key[0] in ("month", "day") and value is not None:
+                old = next((t for t in value if t["_id"] == task_id), None)
+                if old is not None:
+                    break
+        if old is not None and old == task:
+            return
+
+        for key, value in entries:
+            if value is None:
+                continue
+            kind = key[0]
+            if kind in ("month", "day"):
+                tasks = [t for t in value if t["_id"] != task_id]
+                if task is not None and _key_affected(key, task):
+                    tasks.append(task)
+                    tasks.sort(key=lambda t: t["fecha_hora"])
+                if tasks != value:
+                    cache[key] = tasks
+            elif kind == "comments":
+                if key[1] == str(task_id):
+                    cache.pop(key, None)
+            elif kind != "recurring":
+                # Sin la versión anterior no se sabe dónde aparecía la tarea
+                if old is None or any(_key_affected(key, t) for t in (old, task) if t):
+                    cache.pop(key, None)
+
+        _bump_month_version(old)
+        _bump_month_version(task)
+
+
+# Watcher de cambios: un hilo por proceso que sigue la colección de tareas con un
+# change stream, o consultando ultima_actualizacion si el servidor no los soporta
+WATCH_POLL_SECONDS = 5
+# Códigos de error con los que el servidor indica que no hay change streams
+CHANGE_STREAM_UNSUPPORTED = {40573, 40324}
+
+_watcher = None
+_watcher_lock = threading.Lock()
+_watcher_stop = threading.Event()
+
+
+def start_change_watcher():
+    """Inicia el watcher de cambios del proceso si aún no está corriendo"""
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None or not _watcher.is_alive():
+            _watcher_stop.clear()
+            _watcher = threading.Thread(target=_watch_tasks, name="tasks-watcher", daemon=True)
+            _watcher.start()
+
+
+def stop_change_watcher():
+    """Detiene el watcher de cambios y espera a que termine"""
+    global _watcher
+    with _watcher_lock:
+        watcher, _watcher = _watcher, None
+    _watcher_stop.set()
+    if watcher is not None and watcher is not threading.current_thread():
+        watcher.join(timeout=WATCH_POLL_SECONDS * 2)
+
+
+def _watch_tasks():
+    tasks_collection = connect_to_mongo("users").tasks
+    if not load_config().get("change_streams", True):
+        return _poll_tasks(tasks_collection)
+
+    resume_token = None
+    while not _watcher_stop.is_set():
+        try:
+            with tasks_collection.watch(
+                full_document="updateLookup",
+                resume_after=resume_token,
+                max_await_time_ms=1000
+            ) as stream:
+                while not _watcher_stop.is_set():
+                    change = stream.try_next()
+                    if change is None:
+                        continue
+                    resume_token = stream.resume_token
+                    if change["operationType"] in ("insert", "update", "replace"):
+                        task = change.get("fullDocument")
+                        if task is not None:
+                            apply_task_change(task["_id"], _list_view(task))
+                    elif change["operationType"] == "delete":
+                        apply_task_change(change["documentKey"]["_id"], None)
+                    elif change["operationType"] in ("drop", "rename", "invalidate"):
+                        resume_token = None
+                        clear_cache()
+                        break
+        except OperationFailure as e:
+            if e.code in CHANGE_STREAM_UNSUPPORTED:
+                return _poll_tasks(tasks_collection)
+            # Por ejemplo, el token ya no está en el oplog: se empieza de nuevo
+            resume_token = None
+            clear_cache()
+            _watcher_stop.wait(WATCH_POLL_SECONDS)
+        except PyMongoError:
+            _watcher_stop.wait(WATCH_POLL_SECONDS)
+
+
+def _poll_tasks(tasks_collection):
+    interval = load_config().get("watch_poll_seconds", WATCH_POLL_SECONDS)
+    since = datetime.now()
+    while not _watcher_stop.wait(interval):
+        try:
+            changed, removed, mark = get_task_changes(since)
+        except PyMongoError:
+            continue
+        for task in changed:
+            apply_task_change(task["_id"], task)
+        for task_id in removed:
+            apply_task_change(task_id, None)
+        since = mark
+
+
+@dataclass
+class MutationResult:
+    """
+    Resultado de una mutación. status es "ok", "queued" (en la cola de escritura
+    diferida), "conflict" (la tarea cambió desde que se leyó) o "not_found";
+    task es la tarea después del cambio o, en un conflicto, la versión actual.
+    Es verdadero si status es "ok" o "queued"
+    """
+    status: str
+    task: dict = None
+
+    MESSAGES = {
+        "ok": "Cambios guardados",
+        "queued": "Cambios en cola",
+        "conflict": "Otro usuario modificó esta tarea mientras la tenías abierta; se muestra la versión actual",
+        "not_found": "La tarea ya no existe",
+    }
+
+    def __bool__(self):
+        return self.status in ("ok", "queued")
+
+    @property
+    def message(self):
+        return self.MESSAGES[self.status]
+
+
+def _now():
+    """datetime.now() con la precisión de milisegundos que guarda Mongo"""
+    now = datetime.now()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def _task_filter(task_id, expected):
+    """
+    Filtro de una mutación. Si expected es la ultima_actualizacion con la que se
+    leyó la tarea, la mutación solo se aplica si nadie la cambió desde entonces
+    """
+    query = {"_id": ObjectId(task_id)}
+    if expected is not None:
+        query["ultima_actualizacion"] = expected
+    return query
+
+
+def _failed_mutation(tasks_collection, task_id):
+    """Distingue un conflicto de una tarea eliminada; solo corre cuando la mutación falla"""
+    current = tasks_collection.find_one({"_id": ObjectId(task_id)}, TASK_LIST_PROJECTION)
+    if current is None:
+        return MutationResult("not_found")
+    # La versión en caché quedó vieja
+    invalidate_tasks(current)
+    return MutationResult("conflict", current)
+
+
+def _apply_update(task, update):
+    """Aplica localmente a task los operadores de update que usan las mutaciones"""
+    task = dict(task, **update.get("$set", {}))
+    for field, amount in update.get("$inc", {}).items():
+        task[field] = task.get(field, 0) + amount
+    for field, push in update.get("$push", {}).items():
+        task[field] = (list(task.get(field) or []) + push["$each"])[push["$slice"]:]
+    return task
+
+
+# Resumen por día materializado en task_daily_summary: un documento por día
+# (_id = medianoche) con el total de tareas y conteos por estado y por asignado.
+# Las mutaciones lo mantienen con $inc; rebuild_daily_summary lo recalcula
+def _summary_changes(before, after):
+    """Incrementos por día de task_daily_summary para pasar de before a after"""
+    changes = {}
+    for task, sign in ((before, -1), (after, 1)):
+        if not task or not isinstance(task.get("fecha_hora"), datetime):
+            continue
+        fecha_hora = task["fecha_hora"]
+        increments = changes.setdefault(datetime(fecha_hora.year, fecha_hora.month, fecha_hora.day), {})
+        fields = ["total", f"estados.{task.get('estado') or 'sin_estado'}"]
+        if task.get("asignado_a"):
+            fields.append(f"asignados.{task['asignado_a']}")
+        for field in fields:
+            increments[field] = increments.get(field, 0) + sign
+    return {
+        day: {field: amount for field, amount in increments.items() if amount}
+        for day, increments in changes.items()
+    }
+
+
+def _update_daily_summary(db, *pairs):
+    """Aplica los cambios de varios pares (antes, después) en un solo bulk_write"""
+    requests = [
+        UpdateOne({"_id": day}, {"$inc": increments}, upsert=True)
+        for before, after in pairs
+        for day, increments in _summary_changes(before, after).items()
+        if increments
+    ]
+    if requests:
+        db.task_daily_summary.bulk_write(requests, ordered=False)
+
+
+def _count_map(values):
+    """Expresión de agregación que cuenta cuántas veces aparece cada valor de un arreglo"""
+    return {"$arrayToObject": {"$map": {
+        "input": {"$setDifference": [{"$setUnion": [values, []]}, [None]]},
+        "as": "valor",
+        "in": {
+            "k": "$$valor",
+            "v": {"$size": {"$filter": {"input": values, "cond": {"$eq": ["$$this", "$$valor"]}}}}
+        }
+    }}}
+
+
+def _rebuild_daily_summary(db, start=None, end=None):
+    stamp = _now()
+    match = {"fecha_hora": {"$type": "date"}}
+    stale = {"reconstruido": {"$ne": stamp}}
+    if start and end:
+        match["fecha_hora"] = {"$gte": start, "$lt": end}
+        stale["_id"] = {"$gte": start, "$lt": end}
+
+    db.tasks.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": {"$dateFromParts": {
+                "year": {"$year": "$fecha_hora"},
+                "month": {"$month": "$fecha_hora"},
+                "day": {"$dayOfMonth": "$fecha_hora"}
+            }},
+            "total": {"$sum": 1},
+            "estados": {"$push": {"$ifNull": ["$estado", "sin_estado"]}},
+            "asignados": {"$push": "$asignado_a"}
+        }},
+        {"$project": {
+            "total": 1,
+            "estados": _count_map("$estados"),
+            "asignados": _count_map("$asignados"),
+            "reconstruido": {"$literal": stamp}
+        }},
+        {"$merge": {"into": "task_daily_summary", "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ])
+    # Días que ya no tienen tareas
+    db.task_daily_summary.delete_many(stale)
+    invalidate_kinds("summary")
+
+
+def rebuild_daily_summary(start=None, end=None):
+    """
+    Recalcula task_daily_summary desde tasks con $merge, completo o solo entre
+    start y end (datetimes, end excluido), y borra los días del rango que
+    quedaron sin tareas. Sirve para reparar el resumen si algo lo desincronizó
+    """
+    _rebuild_daily_summary(connect_to_mongo("users"), start, end)
+
+
+def _ensure_daily_summary(db):
+    """Construye el resumen la primera vez, si hay tareas y el resumen está vacío"""
+    if db.task_daily_summary.estimated_document_count() == 0 and db.tasks.find_one({}, {"_id": 1}):
+        _rebuild_daily_summary(db)
+
+
+def _update_task(tasks_collection, task_id, update, comment=None, expected=None, deferrable=False):
+    """
+    Aplica update a una tarea en una sola operación atómica e invalida la caché.
+    Si se pasa comment, además se guarda en la colección de comentarios y se
+    actualizan num_comentarios y comentarios_recientes. Siempre actualiza
+    ultima_actualizacion; con expected falla si la tarea cambió desde esa fecha.
+    Con deferrable y la escritura diferida activa, se encola y expected se
+    comprueba al aplicar el lote.
+    Devuelve un MutationResult con la tarea actualizada
+    """
+    if task_id is None:
+        return MutationResult("not_found")
+    if deferrable and write_behind_enabled():
+        return _enqueue_update(task_id, update, comment, expected)
+    update = dict(update)
+    update["$set"] = dict(update.get("$set", {}), ultima_actualizacion=_now())
+    comment_doc = None
+    if comment is not None:
+        comment_doc = {"texto": comment, "fecha": datetime.now()}
+        update = _with_comment(update, comment_doc)
+
+    # Se pide la versión anterior para invalidar también el mes o día de
+    # origen; la nueva se calcula sin otra consulta
+    before = tasks_collection.find_one_and_update(
+        _task_filter(task_id, expected),
+        update,
+        projection=TASK_LIST_PROJECTION,
+        return_document=ReturnDocument.BEFORE
+    )
+    if not before:
+        return _failed_mutation(tasks_collection, task_id)
+
+    if comment_doc is not None:
+        tasks_collection.database.comments.insert_one(dict(comment_doc, task_id=before["_id"]))
+
+    after = _apply_update(before, update)
+    _update_daily_summary(tasks_collection.database, (before, after))
+    _remember_writes((before["_id"], after["ultima_actualizacion"]))
+    invalidate_tasks(before, after)
+    return MutationResult("ok", after)
+
+
+def _delete_task(tasks_collection, task_id, expected=None):
+    """Elimina una tarea e invalida la caché. Devuelve un MutationResult con la tarea eliminada"""
+    before = tasks_collection.find_one_and_delete(_task_filter(task_id, expected), projection=TASK_LIST_PROJECTION)
+    if not before:
+        return _failed_mutation(tasks_collection, task_id)
+    tasks_collection.database.comments.delete_many({"task_id": before["_id"]})
+    # Marca de borrado para que get_task_changes informe la eliminación
+    tasks_collection.database.deleted_tasks.insert_one({
+        "task_id": before["_id"],
+        "fecha_hora": before.get("fecha_hora"),
+        "eliminado": datetime.now()
+    })
+    _update_daily_summary(tasks_collection.database, (before, None))
+    _remember_writes((before["_id"], _DELETED))
+    invalidate_tasks(before)
+    return MutationResult("ok", before)
+
+
+# Escritura diferida (opcional, write_behind = true en [mongo]): los comentarios
+# y cambios de estado del calendario se encolan y se devuelven al instante. Un
+# hilo junta la cola en bulk_write, reintenta si se cae la conexión y guarda la
+# cola en un archivo local para no perderla si el proceso muere
+WRITE_BEHIND_SPILL_PATH = ".streamlit/write_behind.jsonl"
+WRITE_BEHIND_INTERVAL_SECONDS = 0.5
+WRITE_BEHIND_BATCH_SIZE = 200
+WRITE_BEHIND_ATTEMPTS = 5
+# Las operaciones aplicadas se registran en la colección operaciones_aplicadas
+# (con TTL) para que reproducir el archivo no aplique dos veces la misma
+
+_wb_queue = []
+_wb_pending = {}
+_wb_failed = deque(maxlen=100)
+_wb_condition = threading.Condition()
+_wb_thread = None
+_wb_stop = threading.Event()
+
+
+def start_write_behind():
+    """
+    Inicia la escritura diferida si write_behind está activado en la
+    configuración. Antes de empezar carga las operaciones que quedaron en el
+    archivo local
+    """
+    global _wb_thread
+    if not load_config().get("write_behind", False):
+        return
+    with _wb_condition:
+        if _wb_thread is not None and _wb_thread.is_alive():
+            return
+        _wb_stop.clear()
+        _wb_thread = threading.Thread(target=_write_behind_worker, name="write-behind", daemon=True)
+        _wb_thread.start()
+
+
+def stop_write_behind():
+    """Detiene la escritura diferida después de intentar vaciar la cola"""
+    global _wb_thread
+    with _wb_condition:
+        thread, _wb_thread = _wb_thread, None
+        _wb_stop.set()
+        _wb_condition.notify_all()
+    if thread is not None and thread is not threading.current_thread():
+        thread.join(timeout=WRITE_BEHIND_INTERVAL_SECONDS * 20)
+
+
+def write_behind_enabled():
+    return _wb_thread is not None
+
+
+def get_write_behind_stats():
+    """Operaciones en cola y últimas que no se pudieron aplicar"""
+    with _wb_condition:
+        return {"pendientes": len(_wb_queue), "fallidas": list(_wb_failed)}
+
+
+def _enqueue_update(task_id, update, comment=None, expected=None):
+    """
+    Encola una mutación de _update_task y devuelve al instante. La operación
+    lleva su propia ultima_actualizacion, así que quien la ve en cola y vuelve a
+    cambiar la tarea pasa esa fecha como expected
+    """
+    if task_id is None:
+        return MutationResult("not_found")
+    update = dict(update)
+    update["$set"] = dict(update.get("$set", {}), ultima_actualizacion=_now())
+    operation = {
+        "_id": ObjectId(),
+        "task_id": ObjectId(task_id),
+        "update": update,
+        "comment": None,
+        "expected": expected
+    }
+    if comment is not None:
+        operation["comment"] = {"_id": operation["_id"], "texto": comment, "fecha": _now()}
+        operation["update"] = _with_comment(update, {"texto": comment, "fecha": operation["comment"]["fecha"]})
+
+    with _wb_condition:
+        with open(WRITE_BEHIND_SPILL_PATH, "a", encoding="utf-8") as spill:
+            spill.write(json_util.dumps(operation) + "\n")
+            spill.flush()
+            os.fsync(spill.fileno())
+        _wb_queue.append(operation)
+        _wb_pending.setdefault(operation["task_id"], []).append(operation)
+        if len(_wb_queue) >= WRITE_BEHIND_BATCH_SIZE:
+            _wb_condition.notify_all()
+    return MutationResult("queued")
+
+
+def _with_pending(tasks):
+    """
+    Aplica a una lista de tareas las operaciones que siguen en cola, para que
+    quien hizo el cambio lo vea antes de que llegue a Mongo. Los resúmenes y la
+    pertenencia a las listas se ponen al día al aplicarse el lote
+    """
+    if not _wb_pending:
+        return tasks
+    return [_pending_view(task) for task in tasks]
+
+
+def _pending_view(task):
+    if task is None or not _wb_pending:
+        return task
+    with _wb_condition:
+        for operation in _wb_pending.get(task["_id"], ()):
+            task = _apply_update(task, operation["update"])
+    return task
+
+
+def _with_pending_comments(task_id, comments):
+    """Antepone a la primera página de comentarios los que siguen en cola"""
+    if not _wb_pending:
+        return comments
+    with _wb_condition:
+        queued = [
+            dict(operation["comment"])
+            for operation in reversed(_wb_pending.get(ObjectId(task_id), ()))
+            if operation["comment"]
+        ]
+    seen = {comment["_id"] for comment in comments}
+    return [comment for comment in queued if comment["_id"] not in seen] + comments
+
+
+def _spill_rewrite():
+    """Reemplaza el archivo local por la cola actual; se llama con _wb_condition tomado"""
+    temporary = WRITE_BEHIND_SPILL_PATH + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as spill:
+        for operation in _wb_queue:
+            spill.write(json_util.dumps(operation) + "\n")
+        spill.flush()
+        os.fsync(spill.fileno())
+    os.replace(temporary, WRITE_BEHIND_SPILL_PATH)
+
+
+def _spill_load():
+    """Devuelve las operaciones del archivo local que aún no se aplicaron"""
+    if not os.path.exists(WRITE_BEHIND_SPILL_PATH):
+        return []
+    with open(WRITE_BEHIND_SPILL_PATH, encoding="utf-8") as spill:
+        operations = [json_util.loads(line) for line in spill if line.strip()]
+    if not operations:
+        return []
+    db = connect_to_mongo("users")
+    applied = {
+        record["_id"]
+        for record in db.operaciones_aplicadas.find({"_id": {"$in": [operation["_id"] for operation in operations]}})
+    }
+    # Si el proceso murió entre actualizar la tarea y registrar sus operaciones,
+    # la tarea guarda la última que aplicó; las anteriores de esa tarea en el
+    # archivo llegaron en el mismo lote o en uno previo
+    last = {
+        task["_id"]: task["ultima_operacion"]
+        for task in db.tasks.find(
+            {"_id": {"$in": list({operation["task_id"] for operation in operations})}},
+            {"ultima_operacion": 1}
+        )
+        if "ultima_operacion" in task
+    }
+    for task_id, operation_id in last.items():
+        own = [operation["_id"] for operation in operations if operation["task_id"] == task_id]
+        if operation_id in own:
+            applied.update(own[:own.index(operation_id) + 1])
+    return [operation for operation in operations if operation["_id"] not in applied]
+
+
+def _write_behind_worker():
+    # Hasta cargar el archivo no se escribe nada, para no reemplazarlo con una
+    # cola incompleta
+    while True:
+        try:
+            replay = _spill_load()
+            break
+        except PyMongoError:
+            if _wb_stop.wait(WATCH_POLL_SECONDS):
+                return
+    with _wb_condition:
+        # Las operaciones reproducidas van antes que las encoladas mientras tanto
+        queued = {operation["_id"] for operation in _wb_queue}
+        _wb_queue[:0] = [operation for operation in replay if operation["_id"] not in queued]
+        _wb_pending.clear()
+        for operation in _wb_queue:
+            _wb_pending.setdefault(operation["task_id"], []).append(operation)
+        _spill_rewrite()
+
+    while True:
+        with _wb_condition:
+            if not _wb_stop.is_set() and len(_wb_queue) < WRITE_BEHIND_BATCH_SIZE:
+                _wb_condition.wait(WRITE_BEHIND_INTERVAL_SECONDS)
+            batch = _wb_queue[:WRITE_BEHIND_BATCH_SIZE]
+        if not batch:
+            if _wb_stop.is_set():
+                return
+            continue
+        try:
+            _flush_write_behind(batch)
+        except PyMongoError:
+            # Sin servidor la cola sigue en el archivo; se reintenta más tarde
+            if _wb_stop.wait(WATCH_POLL_SECONDS):
+                return
+
+
+def _merge_operations(operations):
+    """
+    Une en orden las operaciones en cola de una tarea. Devuelve el expected de
+    la primera, que va en el filtro, las operaciones aceptadas, su update
+    combinado y las que chocan: traen un expected distinto de la versión que
+    dejó la operación anterior
+    """
+    accepted = [operations[0]]
+    conflicts = []
+    for operation in operations[1:]:
+        version = accepted[-1]["update"].get("$set", {}).get("ultima_actualizacion")
+        if operation.get("expected") is not None and operation["expected"] != version:
+            conflicts.append(operation)
+        else:
+            accepted.append(operation)
+
+    update = {"$set": {}, "$inc": {}, "$push": {}}
+    for operation in accepted:
+        update["$set"].update(operation["update"].get("$set", {}))
+        for field, amount in operation["update"].get("$inc", {}).items():
+            update["$inc"][field] = update["$inc"].get(field, 0) + amount
+        for field, push in operation["update"].get("$push", {}).items():
+            merged = update["$push"].setdefault(field, {"$each": [], "$slice": push["$slice"]})
+            merged["$each"] = merged["$each"] + push["$each"]
+    return operations[0].get("expected"), accepted, update, conflicts
+
+
+@retry(
+    retry=retry_if_exception_type(ConnectionFailure),
+    stop=stop_after_attempt(WRITE_BEHIND_ATTEMPTS),
+    wait=wait_exponential(multiplier=WRITE_BEHIND_INTERVAL_SECONDS, max=10),
+    reraise=True
+)
+def _flush_write_behind(batch):
+    """
+    Aplica un lote de la cola. Las operaciones de una misma tarea se unen en
+    una sola, en orden de llegada; si la primera trae expected, la tarea tiene
+    que seguir en esa versión. Todo el lote se puede repetir sin aplicar nada
+    dos veces
+    """
+    db = connect_to_mongo("users")
+    stamp = _now()
+
+    groups = {}
+    for operation in batch:
+        groups.setdefault(operation["task_id"], []).append(operation)
+    merged = {task_id: _merge_operations(operations) for task_id, operations in groups.items()}
+
+    # Los comentarios van primero con _id fijo: si el proceso muere después,
+    # el comentario ya está y la tarea se actualiza al reproducir la cola
+    comments = [dict(op["comment"], task_id=op["task_id"]) for op in batch if op["comment"]]
+    if comments:
+        try:
+            db.comments.insert_many(comments, ordered=False)
+        except BulkWriteError as e:
+            if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+
+    task_ids = list(groups)
+    # Solo los cambios de estado mueven el resumen diario; para ellos se lee la
+    # versión anterior antes de escribir
+    changes_summary = any(
+        field in CACHE_FIELDS for operation in batch for field in operation["update"].get("$set", {})
+    )
+    before = {}
+    if changes_summary:
+        before = {task["_id"]: task for task in db.tasks.find({"_id": {"$in": task_ids}}, CACHE_FIELDS)}
+
+    requests = []
+    for task_id in task_ids:
+        expected, accepted, update, _ = merged[task_id]
+        last = accepted[-1]["_id"]
+        # ultima_operacion hace que repetir el lote no vuelva a sumar ni a
+        # agregar comentarios aunque no se haya llegado a registrar
+        update["$set"].setdefault("ultima_actualizacion", stamp)
+        update["$set"]["ultima_operacion"] = last
+        update["$unset"] = {"operaciones_aplicadas": ""}
+        query = {"_id": task_id, "ultima_operacion": {"$ne": last}}
+        if expected is not None:
+            query["ultima_actualizacion"] = expected
+        requests.append(UpdateOne(query, {operator: fields for operator, fields in update.items() if fields}))
+
+    errors = {}
+    try:
+        db.tasks.bulk_write(requests, ordered=False)
+    except BulkWriteError as e:
+        errors = {error["index"]: error["errmsg"] for error in e.details.get("writeErrors", [])}
+
+    current = {
+        task["_id"]: task
+        for task in db.tasks.find(
+            {"_id": {"$in": task_ids}}, dict(CACHE_FIELDS, ultima_actualizacion=1, ultima_operacion=1)
+        )
+    }
+    applied = []
+    applied_operations = []
+    conflicted = []
+    failed = []
+    for index, task_id in enumerate(task_ids):
+        _, accepted, _, conflicts = merged[task_id]
+        task = current.get(task_id)
+        failed.extend((operation, "conflict", MutationResult.MESSAGES["conflict"]) for operation in conflicts)
+        if task is not None and task.get("ultima_operacion") == accepted[-1]["_id"]:
+            applied.append(task)
+            applied_operations.extend(accepted)
+            continue
+        if index in errors:
+            status, reason = "error", errors[index]
+        elif task is None:
+            status, reason = "not_found", MutationResult.MESSAGES["not_found"]
+        else:
+            status, reason = "conflict", MutationResult.MESSAGES["conflict"]
+        failed.extend((operation, status, reason) for operation in accepted)
+        if task is not None:
+            conflicted.append(task)
+
+    if applied_operations:
+        try:
+            db.operaciones_aplicadas.insert_many([
+                {"_id": operation["_id"], "task_id": operation["task_id"], "fecha": stamp}
+                for operation in applied_operations
+            ], ordered=False)
+        except BulkWriteError as e:
+            if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+
+    orphan_comments = [operation["_id"] for operation, _, _ in failed if operation["comment"]]
+    if orphan_comments:
+        db.comments.delete_many({"_id": {"$in": orphan_comments}})
+
+    done = {operation["_id"] for operation in batch}
+    with _wb_condition:
+        _wb_queue[:] = [operation for operation in _wb_queue if operation["_id"] not in done]
+        for task_id in task_ids:
+            remaining = [operation for operation in _wb_pending.get(task_id, []) if operation["_id"] not in done]
+            if remaining:
+                _wb_pending[task_id] = remaining
+            else:
+                _wb_pending.pop(task_id, None)
+        for operation, status, reason in failed:
+            _wb_failed.append({
+                "task_id": str(operation["task_id"]),
+                "estado": status,
+                "error": reason,
+                "fecha": stamp.isoformat()
+            })
+        _spill_rewrite()
+
+    if changes_summary:
+        _update_daily_summary(db, *[(before.get(task["_id"]), task) for task in applied])
+    _remember_writes(*[(task["_id"], task["ultima_actualizacion"]) for task in applied])
+    # Quien tenía abierta una tarea en conflicto ve la versión actual
+    invalidate_tasks(*applied, *conflicted)
+    invalidate_kinds("filtered", "pending")
+
+
+@instrumented
 def login(username, password):
     db = connect_to_mongo("users")
     data_collection = db.data
@@ -21,98 +1421,588 @@ def login(username, password):
     else:
         return False
 
-def add_task(task_name, task_description, task_date, task_time, assigned_to):
+def new_task_document(nombre, descripcion, fecha_hora, asignado_a, estado="pendiente"):
+    """Documento de una tarea nueva con todos los campos que esperan las lecturas"""
+    return {
+        "nombre": nombre,
+        "descripcion": descripcion,
+        "fecha_hora": fecha_hora,
+        "asignado_a": asignado_a,
+        "estado": estado,
+        "fecha_creacion": datetime.now(),
+        "ultima_actualizacion": _now(),
+        "num_comentarios": 0,
+        "comentarios_recientes": [],
+        "solicitud_extension": None
+    }
+
+@instrumented
+def add_task(task_name, task_description, task_date, task_time, assigned_to):
+    db = connect_to_mongo("users")
+    tasks_collection = db.tasks
+    
+    task_datetime = datetime.combine(task_date, task_time)
+    task_document = new_task_document(task_name, task_description, task_datetime, assigned_to)
+    
+    result = tasks_collection.insert_one(task_document)
+    _update_daily_summary(db, (None, task_document))
+    _remember_writes((result.inserted_id, task_document["ultima_actualizacion"]))
+    invalidate_tasks(task_document)
+    return result.inserted_id
+
+
+# Tareas recurrentes. Cada definición guarda una regla RRULE (sin DTSTART) y la
+# lista de excepciones; sus ocurrencias se generan al leer un mes o un día y solo
+# se guardan como tareas reales cuando alguien actúa sobre ellas.
+RECURRENCE_FREQUENCIES = {"diaria": "DAILY", "semanal": "WEEKLY", "mensual": "MONTHLY"}
+WEEKDAY_CODES = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+OCCURRENCE_FORMAT = "%Y%m%dT%H%M"
+
+def build_rrule(frequency, interval=1, weekdays=None, until=None):
+    """
+    Construye la regla RRULE para una frecuencia de RECURRENCE_FREQUENCIES.
+    weekdays son índices 0-6 (lunes a domingo) y until un datetime opcional
+    """
+    parts = [f"FREQ={RECURRENCE_FREQUENCIES[frequency]}", f"INTERVAL={int(interval)}"]
+    if weekdays:
+        parts.append("BYDAY=" + ",".join(WEEKDAY_CODES[day] for day in sorted(weekdays)))
+    if until:
+        parts.append("UNTIL=" + until.strftime("%Y%m%dT%H%M%S"))
+    return ";".join(parts)
+
+@instrumented
+def add_recurring_task(task_name, task_description, start_date, task_time, assigned_to,
+                       frequency, interval=1, weekdays=None, until_date=None):
+    """Crea una tarea recurrente a partir de start_date"""
     db = connect_to_mongo("users")
-    tasks_collection = db.tasks
-    
-    task_datetime = datetime.combine(task_date, task_time)
-    
-    task_document = {
+
+    dtstart = datetime.combine(start_date, task_time)
+    until = datetime.combine(until_date, datetime.max.time()).replace(microsecond=0) if until_date else None
+
+    definition = {
         "nombre": task_name,
         "descripcion": task_description,
-        "fecha_hora": task_datetime,
         "asignado_a": assigned_to,
+        "dtstart": dtstart,
+        "hasta": until,
+        "rrule": build_rrule(frequency, interval, weekdays, until),
+        "excepciones": [],
+        "fecha_creacion": datetime.now()
+    }
+
+    result = db.recurring_tasks.insert_one(definition)
+    invalidate_kinds("recurring", "month", "day", "summary", "upcoming")
+    return result.inserted_id
+
+@instrumented
+def get_recurring_tasks():
+    """Obtiene todas las definiciones de tareas recurrentes"""
+    db = connect_to_mongo("users")
+    return _cached(("recurring",), lambda: list(db.recurring_tasks.find().sort("dtstart", 1)))
+
+def occurrence_id(definition_id, fecha_hora):
+    return f"{definition_id}:{fecha_hora.strftime(OCCURRENCE_FORMAT)}"
+
+def parse_occurrence_id(task_id):
+    """Devuelve (id de la definición, fecha_hora) o None si task_id no es una ocurrencia"""
+    if not isinstance(task_id, str) or ":" not in task_id:
+        return None
+    definition_id, fecha = task_id.split(":", 1)
+    return ObjectId(definition_id), datetime.strptime(fecha, OCCURRENCE_FORMAT)
+
+def expand_occurrences(start, end, materialized=()):
+    """
+    Genera las ocurrencias virtuales entre start (incluido) y end (excluido).
+    materialized son pares (recurrencia_id, fecha_original) que ya existen como
+    tareas reales y se omiten
+    """
+    materialized = set(materialized)
+    occurrences = []
+    for definition in get_recurring_tasks():
+        if definition["dtstart"] >= end or (definition.get("hasta") and definition["hasta"] < start):
+            continue
+        rule = rrulestr(definition["rrule"], dtstart=definition["dtstart"])
+        exceptions = set(definition.get("excepciones", []))
+        for fecha_hora in rule.between(start, end, inc=True):
+            if fecha_hora >= end or fecha_hora in exceptions:
+                continue
+            if (definition["_id"], fecha_hora) in materialized:
+                continue
+            occurrences.append({
+                "_id": occurrence_id(definition["_id"], fecha_hora),
+                "recurrencia_id": definition["_id"],
+                "nombre": definition["nombre"],
+                "descripcion": definition["descripcion"],
+                "fecha_hora": fecha_hora,
+                "asignado_a": definition["asignado_a"],
+                "estado": "pendiente",
+                "num_comentarios": 0,
+                "comentarios_recientes": [],
+                "virtual": True
+            })
+    return occurrences
+
+def _with_occurrences(tasks, start, end):
+    """Agrega a una lista de tareas reales las ocurrencias virtuales de su ventana"""
+    materialized = [
+        (task["recurrencia_id"], task["fecha_original"])
+        for task in tasks if task.get("recurrencia_id")
+    ]
+    occurrences = expand_occurrences(start, end, materialized)
+    if not occurrences:
+        return tasks
+    return sorted(tasks + occurrences, key=lambda task: task["fecha_hora"])
+
+@instrumented
+def resolve_task_id(task_id):
+    """
+    Si task_id es una ocurrencia virtual la guarda como tarea real y devuelve
+    su _id; en otro caso devuelve task_id sin cambios
+    """
+    occurrence = parse_occurrence_id(task_id)
+    if occurrence is None:
+        return task_id
+
+    definition_id, fecha_hora = occurrence
+    db = connect_to_mongo("users")
+    definition = db.recurring_tasks.find_one({"_id": definition_id})
+    if not definition:
+        return None
+
+    task_document = {
+        "nombre": definition["nombre"],
+        "descripcion": definition["descripcion"],
+        "fecha_hora": fecha_hora,
+        "asignado_a": definition["asignado_a"],
         "estado": "pendiente",
         "fecha_creacion": datetime.now(),
         "ultima_actualizacion": datetime.now(),
-        "comentarios": [],
-        "solicitud_extension": None
+        "num_comentarios": 0,
+        "comentarios_recientes": [],
+        "solicitud_extension": None,
+        "recurrencia_id": definition_id,
+        "fecha_original": fecha_hora
     }
-    
-    result = tasks_collection.insert_one(task_document)
-    return result.inserted_id
+    key = {"recurrencia_id": definition_id, "fecha_original": fecha_hora}
+    task = None
+    try:
+        result = db.tasks.update_one(key, {"$setOnInsert": task_document}, upsert=True)
+        if result.upserted_id is not None:
+            task = {"_id": result.upserted_id}
+            _update_daily_summary(db, (None, task_document))
+    except DuplicateKeyError:
+        # Otra sesión la materializó al mismo tiempo
+        pass
+    if task is None:
+        task = db.tasks.find_one(key, {"_id": 1})
+
+    # La ocurrencia ya no debe generarse aunque la tarea cambie de fecha
+    db.recurring_tasks.update_one({"_id": definition_id}, {"$addToSet": {"excepciones": fecha_hora}})
+    invalidate_kinds("recurring")
+    invalidate_tasks(task_document)
+    return task["_id"]
+
+@instrumented
+def skip_occurrence(task_id):
+    """Omite una ocurrencia de una tarea recurrente sin crear una tarea real"""
+    occurrence = parse_occurrence_id(task_id)
+    if occurrence is None:
+        return False
+
+    definition_id, fecha_hora = occurrence
+    db = connect_to_mongo("users")
+    result = db.recurring_tasks.update_one({"_id": definition_id}, {"$addToSet": {"excepciones": fecha_hora}})
+    invalidate_kinds("recurring", "month", "day", "summary", "upcoming")
+    return result.modified_count > 0
+
+@instrumented
+def end_recurring_task(definition_id, last_date):
+    """
+    Termina una tarea recurrente: deja de generar ocurrencias después de
+    last_date (incluida). Las ocurrencias guardadas como tareas reales se conservan
+    """
+    db = connect_to_mongo("users")
+    definition = db.recurring_tasks.find_one({"_id": ObjectId(definition_id)}, {"rrule": 1})
+    if definition is None:
+        return False
+
+    until = datetime.combine(last_date, datetime.max.time()).replace(microsecond=0)
+    parts = [part for part in definition["rrule"].split(";") if not part.startswith("UNTIL=")]
+    parts.append("UNTIL=" + until.strftime("%Y%m%dT%H%M%S"))
+    result = db.recurring_tasks.update_one(
+        {"_id": definition["_id"]},
+        {"$set": {"hasta": until, "rrule": ";".join(parts)}}
+    )
+    invalidate_kinds("recurring", "month", "day", "summary", "upcoming")
+    return result.matched_count > 0
+
+@instrumented
+def delete_recurring_task(definition_id):
+    """
+    Elimina una tarea recurrente y sus ocurrencias sin guardar. Las ocurrencias
+    guardadas como tareas reales se conservan
+    """
+    db = connect_to_mongo("users")
+    result = db.recurring_tasks.delete_one({"_id": ObjectId(definition_id)})
+    invalidate_kinds("recurring", "month", "day", "summary", "upcoming")
+    return result.deleted_count > 0
+
+# Proyección para listas de tareas: el historial de comentarios está en la
+# colección comments y aquí solo van su cantidad y los últimos RECENT_COMMENTS
+TASK_LIST_PROJECTION = {
+    "nombre": 1,
+    "descripcion": 1,
+    "fecha_hora": 1,
+    "asignado_a": 1,
+    "estado": 1,
+    "fecha_creacion": 1,
+    "ultima_actualizacion": 1,
+    "solicitud_extension": 1,
+    "razon_imposible": 1,
+    "comentarios_recientes": 1,
+    "recurrencia_id": 1,
+    "fecha_original": 1,
+    "num_comentarios": 1,
+}
 
+@instrumented
 def get_month_tasks(year, month):
-    """Obtiene todas las tareas para un mes específico"""
+    """Obtiene todas las tareas para un mes específico, ordenadas por fecha_hora"""
     db = connect_to_mongo("users")
     tasks_collection = db.tasks
     
-    start_date = datetime(year, month, 1)
-    if month == 12:
-        end_date = datetime(year + 1, 1, 1)
+    start_date, end_date = month_range(year, month)
+    return _with_pending(_cached(
+        ("month", year, month),
+        lambda: _with_occurrences(_load_month_tasks(tasks_collection, year, month), start_date, end_date)
+    ))
+
+def _load_month_tasks(tasks_collection, year, month):
+    """
+    Trae las tareas reales del mes. Si hay una copia reciente del mes, solo se
+    piden los cambios desde su marca de sincronización
+    """
+    with _cache_lock:
+        snapshot = _month_snapshots.get((year, month))
+
+    if snapshot is not None and snapshot[1] > datetime.now() - SYNC_MAX_AGE:
+        tasks, since = snapshot
+        start_date, end_date = month_range(year, month)
+        changed, removed, mark = get_task_changes(since, start_date, end_date, [task["_id"] for task in tasks])
+        tasks = apply_task_delta(tasks, changed, removed)
     else:
-        end_date = datetime(year, month + 1, 1)
-    
-    tasks = tasks_collection.find({
-        "fecha_hora": {
-            "$gte": start_date,
-            "$lt": end_date
-        }
-    })
-    return list(tasks)
+        mark = datetime.now()
+        tasks = list(tasks_collection.find(month_query(year, month), TASK_LIST_PROJECTION).sort("fecha_hora", 1))
+
+    with _cache_lock:
+        _month_snapshots[(year, month)] = (tasks, mark)
+    return tasks
 
+# Margen para no perder cambios escritos por procesos con el reloj algo atrasado
+SYNC_OVERLAP = timedelta(seconds=2)
+# Las marcas de borrado duran 7 días; una copia más vieja se recarga completa
+SYNC_MAX_AGE = timedelta(days=6)
+
+def changes_query(since, start=None, end=None, known=()):
+    query = {"ultima_actualizacion": {"$gte": since}}
+    if start is not None:
+        query["$or"] = [{"fecha_hora": {"$gte": start, "$lt": end}}, {"_id": {"$in": list(known)}}]
+    return query
+
+@instrumented
+def get_task_changes(since, start=None, end=None, known=()):
+    """
+    Devuelve las tareas que cambiaron desde since como (cambiadas, eliminadas,
+    marca). Con start y end solo se piden las tareas dentro de ese rango y las
+    de known (los ids de la copia que se actualiza); de estas, las que quedaron
+    fuera se informan como eliminadas. La marca se usa como since en la
+    siguiente llamada
+    """
+    db = connect_to_mongo("users")
+
+    mark = datetime.now()
+    since = since - SYNC_OVERLAP
+
+    changed = []
+    removed = []
+    for task in db.tasks.find(changes_query(since, start, end, known), TASK_LIST_PROJECTION):
+        fecha_hora = task.get("fecha_hora")
+        if start is None or (isinstance(fecha_hora, datetime) and start <= fecha_hora < end):
+            changed.append(task)
+        else:
+            removed.append(task["_id"])
+
+    for tombstone in db.deleted_tasks.find({"eliminado": {"$gte": since}}, {"task_id": 1}):
+        removed.append(tombstone["task_id"])
+
+    return changed, removed, mark
+
+def apply_task_delta(tasks, changed, removed):
+    """Aplica a una lista de tareas ordenada por fecha_hora el resultado de get_task_changes"""
+    replaced = set(removed) | {task["_id"] for task in changed}
+    tasks = [task for task in tasks if task["_id"] not in replaced] + changed
+    tasks.sort(key=lambda task: task["fecha_hora"])
+    return tasks
+
+def group_tasks_by_day(tasks):
+    """Agrupa una lista de tareas ordenada por fecha_hora en {día: [tareas]}"""
+    tasks_by_day = {}
+    for task in tasks:
+        fecha_hora = task.get("fecha_hora")
+        if not isinstance(fecha_hora, datetime):
+            continue
+        tasks_by_day.setdefault(fecha_hora.day, []).append(task)
+    return tasks_by_day
+
+COMMENTS_PAGE_SIZE = 20
+
+@instrumented
+def get_task_comments(task_id, page_size=COMMENTS_PAGE_SIZE, cursor=None):
+    """
+    Obtiene una página de comentarios de una tarea, del más reciente al más
+    antiguo, empezando después de cursor. Devuelve (comentarios, cursor_siguiente)
+    """
+    db = connect_to_mongo("users")
+    comments_collection = db.comments
+
+    query = {"task_id": ObjectId(task_id)}
+    if cursor is not None:
+        fecha, comment_id = cursor
+        query["$or"] = [
+            {"fecha": {"$lt": fecha}},
+            {"fecha": fecha, "_id": {"$lt": comment_id}}
+        ]
+
+    def load():
+        comments = list(
+            comments_collection.find(query, {"task_id": 0})
+            .sort([("fecha", -1), ("_id", -1)])
+            .limit(page_size + 1)
+        )
+        if len(comments) <= page_size:
+            return comments, None
+        comments = comments[:page_size]
+        return comments, (comments[-1]["fecha"], comments[-1]["_id"])
+
+    comments, next_cursor = _cached(("comments", str(task_id), cursor, page_size), load)
+    if cursor is None:
+        comments = _with_pending_comments(task_id, comments)
+    return comments, next_cursor
+
+def _legacy_comment_id(task_id, index):
+    # Id fijo por posición: repetir la migración no duplica comentarios
+    return ObjectId(hashlib.md5(f"{task_id}:{index}".encode()).digest()[:12])
+
+LEGACY_COMMENTS_QUERY = {"comentarios": {"$exists": True}}
+
+
+def _migrate_comments(db):
+    """
+    Mueve los arreglos comentarios de las tareas antiguas a la colección de
+    comentarios. Se puede repetir o interrumpir: los comentarios se insertan con
+    id fijo y la tarea se actualiza una sola vez, sumando al contador y a los
+    comentarios recientes los que se agregaron después del arreglo. Devuelve la
+    cantidad de tareas migradas
+    """
+    tasks_collection = db.tasks
+
+    migrated = 0
+    # Sin el hint el planificador no usa el índice parcial (la consulta no filtra
+    # por comentarios.fecha) y recorrería toda la colección en cada arranque
+    cursor = tasks_collection.find(LEGACY_COMMENTS_QUERY, {"comentarios": 1}).hint("comentarios_sin_migrar")
+    for task in cursor:
+        comments = task.get("comentarios") or []
+        if comments:
+            try:
+                db.comments.insert_many([
+                    dict(comment, _id=_legacy_comment_id(task["_id"], index), task_id=task["_id"])
+                    for index, comment in enumerate(comments)
+                ], ordered=False)
+            except BulkWriteError as e:
+                if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+        # Los comentarios del arreglo son anteriores a los recientes que ya tenga
+        update = {"$unset": {"comentarios": ""}, "$inc": {"num_comentarios": len(comments)}}
+        if comments:
+            update["$push"] = {"comentarios_recientes": {
+                "$each": comments[-RECENT_COMMENTS:],
+                "$position": 0,
+                "$slice": -RECENT_COMMENTS
+            }}
+        result = tasks_collection.update_one({"_id": task["_id"], "comentarios": {"$exists": True}}, update)
+        migrated += result.modified_count
+
+    if migrated:
+        clear_cache()
+    return migrated
+
+@instrumented
+def migrate_comments():
+    """Ejecuta la migración de comentarios que get_client hace al conectarse"""
+    return _migrate_comments(connect_to_mongo("users"))
+
+@instrumented
+def get_month_summary(year, month):
+    """
+    Resume por día las tareas de un mes: asignados distintos, total y
+    conteo por estado. Devuelve {día: {"asignados", "total", "estados"}}.
+    Lee a lo sumo un documento por día de task_daily_summary
+    """
+    db = connect_to_mongo("users")
+    tasks_collection = db.tasks
+    start_date, end_date = month_range(year, month)
+
+    def load():
+        summary = {}
+        for row in db.task_daily_summary.find({"_id": {"$gte": start_date, "$lt": end_date}}):
+            if row.get("total", 0) <= 0:
+                continue
+            summary[row["_id"].day] = {
+                "asignados": {name for name, count in row.get("asignados", {}).items() if count > 0},
+                "total": row["total"],
+                "estados": {estado: count for estado, count in row.get("estados", {}).items() if count > 0}
+            }
+
+        # Ocurrencias virtuales de tareas recurrentes que aún no son tareas reales
+        materialized = tasks_collection.find(
+            {"recurrencia_id": {"$exists": True}, "fecha_original": {"$gte": start_date, "$lt": end_date}},
+            {"_id": 0, "recurrencia_id": 1, "fecha_original": 1}
+        ) if get_recurring_tasks() else []
+        for occurrence in expand_occurrences(
+            start_date, end_date, [(task["recurrencia_id"], task["fecha_original"]) for task in materialized]
+        ):
+            day = summary.setdefault(occurrence["fecha_hora"].day, {"asignados": set(), "total": 0, "estados": {}})
+            day["asignados"].add(occurrence["asignado_a"])
+            day["total"] += 1
+            day["estados"]["pendiente"] = day["estados"].get("pendiente", 0) + 1
+        return summary
+
+    return _cached(("summary", year, month), load)
+
+@instrumented
 def get_day_tasks(year, month, day):
     """Obtiene todas las tareas para un día específico"""
     db = connect_to_mongo("users")
     tasks_collection = db.tasks
     
     start_date = datetime(year, month, day)
-    end_date = start_date + timedelta(days=1)
-    
-    tasks = tasks_collection.find({
-        "fecha_hora": {
-            "$gte": start_date,
-            "$lt": end_date
+    return _with_pending(_cached(
+        ("day", year, month, day),
+        lambda: _with_occurrences(
+            list(tasks_collection.find(day_query(year, month, day), TASK_LIST_PROJECTION).sort("fecha_hora", 1)),
+            start_date,
+            start_date + timedelta(days=1)
+        )
+    ))
+
+UPCOMING_HOURS = 24
+# Las tareas próximas se vuelven a consultar a lo sumo una vez por intervalo
+UPCOMING_TTL_SECONDS = 60
+
+@instrumented
+def get_upcoming_tasks(usuarios=None, horas=UPCOMING_HOURS):
+    """
+    Tareas pendientes de usuarios (todas si es None) que vencen en las próximas
+    horas, de cualquier día, de la más próxima a la más lejana. Incluye las
+    ocurrencias de tareas recurrentes que aún no se han guardado
+    """
+    db = connect_to_mongo("users")
+    tasks_collection = db.tasks
+
+    # La consulta cubre el intervalo actual completo, así que sirve para todas
+    # las llamadas del intervalo; lo ya vencido se descarta abajo
+    now = datetime.now()
+    interval = int(now.timestamp()) // UPCOMING_TTL_SECONDS
+    start = datetime.fromtimestamp(interval * UPCOMING_TTL_SECONDS)
+    end = start + timedelta(hours=horas, seconds=UPCOMING_TTL_SECONDS)
+    key = ("upcoming", tuple(usuarios) if usuarios else None, horas, interval)
+
+    def load():
+        tasks = list(tasks_collection.find(upcoming_query(usuarios, start, end), TASK_LIST_PROJECTION).sort("fecha_hora", 1))
+        occurrences = [
+            occurrence for occurrence in expand_occurrences(start, end)
+            if not usuarios or occurrence["asignado_a"] in usuarios
+        ]
+        if not occurrences:
+            return tasks
+        # Las ocurrencias ya guardadas se buscan sin importar su estado
+        materialized = {
+            (task["recurrencia_id"], task["fecha_original"])
+            for task in tasks_collection.find(
+                {
+                    "recurrencia_id": {"$in": list({occurrence["recurrencia_id"] for occurrence in occurrences})},
+                    "fecha_original": {"$in": [occurrence["fecha_hora"] for occurrence in occurrences]}
+                },
+                {"recurrencia_id": 1, "fecha_original": 1}
+            )
         }
-    }).sort("fecha_hora", 1)
-    
-    return list(tasks)
+        tasks.extend(
+            occurrence for occurrence in occurrences
+            if (occurrence["recurrencia_id"], occurrence["fecha_hora"]) not in materialized
+        )
+        return sorted(tasks, key=lambda task: task["fecha_hora"])
+
+    limit = now + timedelta(hours=horas)
+    return [
+        task for task in _with_pending(_cached(key, load))
+        if task.get("estado") == "pendiente" and now < task["fecha_hora"] <= limit
+    ]
+
+@instrumented
+def get_task(task_id):
+    """
+    Lee una sola tarea con la misma forma que las listas, sin pasar por la caché.
+    Para una ocurrencia virtual devuelve la tarea real si ya se guardó o la
+    ocurrencia si sigue sin guardarse; None si la tarea ya no existe
+    """
+    db = connect_to_mongo("users")
+    occurrence = parse_occurrence_id(task_id)
+    if occurrence is None:
+        return _pending_view(db.tasks.find_one({"_id": task_id}, TASK_LIST_PROJECTION))
 
-def add_comment(task_id, comment):
+    definition_id, fecha_hora = occurrence
+    task = db.tasks.find_one(
+        {"recurrencia_id": definition_id, "fecha_original": fecha_hora}, TASK_LIST_PROJECTION
+    )
+    if task:
+        return _pending_view(task)
+    for virtual in expand_occurrences(fecha_hora, fecha_hora + timedelta(minutes=1)):
+        if virtual["_id"] == task_id:
+            return virtual
+    return None
+
+@instrumented
+def add_comment(task_id, comment, expected=None):
     """Añade un comentario a una tarea"""
+    task_id = resolve_task_id(task_id)
     db = connect_to_mongo("users")
     tasks_collection = db.tasks
     
-    comment_doc = {
-        "texto": comment,
-        "fecha": datetime.now()
-    }
-    
-    tasks_collection.update_one(
-        {"_id": task_id},
-        {
-            "$push": {"comentarios": comment_doc},
-            "$set": {"ultima_actualizacion": datetime.now()}
-        }
-    )
+    return _update_task(tasks_collection, task_id, {}, comment=comment, expected=expected, deferrable=True)
 
-def mark_as_completed(task_id):
+@instrumented
+def mark_as_completed(task_id, expected=None):
     """Marca una tarea como completada"""
+    task_id = resolve_task_id(task_id)
     db = connect_to_mongo("users")
     tasks_collection = db.tasks
     
-    tasks_collection.update_one(
-        {"_id": task_id},
+    return _update_task(
+        tasks_collection,
+        task_id,
         {
             "$set": {
-                "estado": "completada",
-                "ultima_actualizacion": datetime.now()
+                "estado": "completada"
             }
-        }
+        },
+        expected=expected,
+        deferrable=True
     )
 
-def request_extension(task_id, reason):
+@instrumented
+def request_extension(task_id, reason, expected=None):
     """Solicita una extensión para una tarea"""
+    task_id = resolve_task_id(task_id)
     db = connect_to_mongo("users")
     tasks_collection = db.tasks
     
@@ -122,158 +2012,148 @@ def request_extension(task_id, reason):
         "estado": "pendiente"
     }
     
-    tasks_collection.update_one(
-        {"_id": task_id},
+    return _update_task(
+        tasks_collection,
+        task_id,
         {
             "$set": {
                 "estado": "extension_solicitada",
-                "solicitud_extension": extension_request,
-                "ultima_actualizacion": datetime.now()
-            }
-        }
+                "solicitud_extension": extension_request
+            },
+            "$inc": {"num_extensiones": 1}
+        },
+        expected=expected,
+        deferrable=True
     )
 
-def mark_as_impossible(task_id, reason):
+@instrumented
+def mark_as_impossible(task_id, reason, expected=None):
     """Marca una tarea como imposible"""
+    task_id = resolve_task_id(task_id)
     db = connect_to_mongo("users")
     tasks_collection = db.tasks
     
-    tasks_collection.update_one(
-        {"_id": task_id},
+    return _update_task(
+        tasks_collection,
+        task_id,
         {
             "$set": {
                 "estado": "imposible",
-                "razon_imposible": reason,
-                "ultima_actualizacion": datetime.now()
-            }
-        }
+                "razon_imposible": reason
+            },
+            "$inc": {"num_imposibles": 1}
+        },
+        expected=expected,
+        deferrable=True
     )
 
 
+@instrumented
 def get_pending_admin_tasks():
     """Obtiene todas las tareas que requieren atención del administrador"""
     db = connect_to_mongo("users")
     tasks_collection = db.tasks
     
     # Buscar tareas con extensión solicitada o marcadas como imposible
-    tasks = tasks_collection.find({
-        "$or": [
-            {"estado": "extension_solicitada"},
-            {"estado": "imposible"}
-        ]
-    }).sort("fecha_hora", 1)
-    
-    return list(tasks)
+    return _with_pending(_cached(
+        ("pending",),
+        lambda: list(tasks_collection.find(pending_admin_query(), TASK_LIST_PROJECTION).sort("fecha_hora", 1))
+    ))
 
-def approve_extension(task_id, new_date, new_time):
+@instrumented
+def approve_extension(task_id, new_date, new_time, expected=None):
     """Aprueba una solicitud de extensión y actualiza la fecha"""
     db = connect_to_mongo("users")
     tasks_collection = db.tasks
     
-    # Obtener la tarea actual
-    task = tasks_collection.find_one({"_id": ObjectId(task_id)})
-    if not task:
-        return False
-        
     # Crear nueva fecha_hora
     new_datetime = datetime.combine(new_date, new_time)
     
     # Actualizar la tarea
-    result = tasks_collection.update_one(
-        {"_id": ObjectId(task_id)},
+    return _update_task(
+        tasks_collection,
+        task_id,
         {
             "$set": {
                 "fecha_hora": new_datetime,
                 "estado": "pendiente",
-                "ultima_actualizacion": datetime.now(),
                 "solicitud_extension": None
-            },
-            "$push": {
-                "comentarios": {
-                    "texto": f"Extensión aprobada. Nueva fecha: {new_datetime.strftime('%Y-%m-%d %H:%M')}",
-                    "fecha": datetime.now()
-                }
             }
-        }
+        },
+        comment=f"Extensión aprobada. Nueva fecha: {new_datetime.strftime('%Y-%m-%d %H:%M')}",
+        expected=expected
     )
-    
-    return result.modified_count > 0
 
-def deny_extension(task_id, reason):
+@instrumented
+def deny_extension(task_id, reason, expected=None):
     """Deniega una solicitud de extensión"""
     db = connect_to_mongo("users")
     tasks_collection = db.tasks
     
-    result = tasks_collection.update_one(
-        {"_id": ObjectId(task_id)},
+    return _update_task(
+        tasks_collection,
+        task_id,
         {
             "$set": {
                 "estado": "pendiente",
-                "ultima_actualizacion": datetime.now(),
                 "solicitud_extension": None
-            },
-            "$push": {
-                "comentarios": {
-                    "texto": f"Extensión denegada. Razón: {reason}",
-                    "fecha": datetime.now()
-                }
             }
-        }
+        },
+        comment=f"Extensión denegada. Razón: {reason}",
+        expected=expected
     )
-    
-    return result.modified_count > 0
 
-def handle_impossible_task(task_id, action, reason=None, new_name=None, new_description=None):
-    """Maneja una tarea marcada como imposible"""
+@instrumented
+def handle_impossible_task(task_id, action, reason=None, new_name=None, new_description=None,
+                           expected=None):
+    """
+    Maneja una tarea marcada como imposible: la modifica o elimina (accept) o la
+    devuelve a pendiente (deny). Devuelve un MutationResult
+    """
     db = connect_to_mongo("users")
     tasks_collection = db.tasks
     
     if action == "accept":
         if new_name and new_description:
             # Actualizar la tarea con nuevos detalles
-            result = tasks_collection.update_one(
-                {"_id": ObjectId(task_id)},
+            result = _update_task(
+                tasks_collection,
+                task_id,
                 {
                     "$set": {
                         "nombre": new_name,
                         "descripcion": new_description,
                         "estado": "pendiente",
-                        "ultima_actualizacion": datetime.now(),
                         "razon_imposible": None
-                    },
-                    "$push": {
-                        "comentarios": {
-                            "texto": "Tarea modificada por el administrador",
-                            "fecha": datetime.now()
-                        }
                     }
-                }
+                },
+                comment="Tarea modificada por el administrador",
+                expected=expected
             )
         else:
             # Eliminar la tarea
-            result = tasks_collection.delete_one({"_id": ObjectId(task_id)})
+            result = _delete_task(tasks_collection, task_id, expected)
         
     elif action == "deny":
         # Denegar y volver a estado pendiente
-        result = tasks_collection.update_one(
-            {"_id": ObjectId(task_id)},
+        result = _update_task(
+            tasks_collection,
+            task_id,
             {
                 "$set": {
                     "estado": "pendiente",
-                    "ultima_actualizacion": datetime.now(),
                     "razon_imposible": None
-                },
-                "$push": {
-                    "comentarios": {
-                        "texto": f"Solicitud de imposibilidad denegada. Razón: {reason}",
-                        "fecha": datetime.now()
-                    }
                 }
-            }
+            },
+            comment=f"Solicitud de imposibilidad denegada. Razón: {reason}",
+            expected=expected
         )
+    else:
+        raise ValueError(f"Acción desconocida: {action}")
     
-    return True
+    return result
 
+@instrumented
 def get_filtered_tasks(estados=None, usuarios=None, fecha_inicio=None, fecha_fin=None):
     """
     Obtiene tareas filtradas según los criterios especificados
@@ -281,26 +2161,234 @@ def get_filtered_tasks(estados=None, usuarios=None, fecha_inicio=None, fecha_fin
     db = connect_to_mongo("users")
     tasks_collection = db.tasks
     
-    # Construir query
-    query = {}
-    
-    if estados:
-        query["estado"] = {"$in": estados}
-        
-    if usuarios:
-        query["asignado_a"] = {"$in": usuarios}
-        
-    if fecha_inicio and fecha_fin:
-        query["fecha_hora"] = {
-            "$gte": datetime.combine(fecha_inicio, datetime.min.time()),
-            "$lte": datetime.combine(fecha_fin, datetime.max.time())
-        }
-    
     # Obtener y ordenar tareas
-    tasks = tasks_collection.find(query).sort("fecha_hora", 1)
-    return list(tasks)
+    query = filtered_query(estados, usuarios, fecha_inicio, fecha_fin)
+    key = _filtered_key(estados, usuarios, fecha_inicio, fecha_fin)
+    return _with_pending(_cached(key, lambda: list(tasks_collection.find(query, TASK_LIST_PROJECTION).sort("fecha_hora", 1))))
+
+def _filtered_key(estados, usuarios, fecha_inicio, fecha_fin):
+    return (
+        "filtered",
+        tuple(estados) if estados else None,
+        tuple(usuarios) if usuarios else None,
+        fecha_inicio if fecha_inicio and fecha_fin else None,
+        fecha_fin if fecha_inicio and fecha_fin else None
+    )
+
+FILTERED_PAGE_SIZE = 20
+
+@instrumented
+def get_filtered_tasks_page(estados=None, usuarios=None, fecha_inicio=None, fecha_fin=None,
+                            page_size=FILTERED_PAGE_SIZE, cursor=None):
+    """
+    Obtiene una página de tareas filtradas ordenadas por (fecha_hora, _id),
+    empezando después de cursor. Devuelve (tareas, cursor_siguiente); el cursor
+    siguiente es None cuando no hay más páginas
+    """
+    db = connect_to_mongo("users")
+    tasks_collection = db.tasks
+
+    query = after_cursor_query(filtered_query(estados, usuarios, fecha_inicio, fecha_fin), cursor)
+    key = _filtered_key(estados, usuarios, fecha_inicio, fecha_fin) + (cursor, page_size)
+
+    def load():
+        # Se pide una tarea de más para saber si existe una página siguiente
+        tasks = list(
+            tasks_collection.find(query, TASK_LIST_PROJECTION)
+            .sort([("fecha_hora", 1), ("_id", 1)])
+            .limit(page_size + 1)
+        )
+        if len(tasks) <= page_size:
+            return tasks, None
+        tasks = tasks[:page_size]
+        return tasks, (tasks[-1]["fecha_hora"], tasks[-1]["_id"])
+
+    tasks, next_cursor = _cached(key, load)
+    return _with_pending(tasks), next_cursor
 
-def update_task(task_id, new_name, new_description, new_date, new_time, new_assigned, new_status):
+SEARCH_PAGE_SIZE = 20
+# Resultados que se ordenan por relevancia; una búsqueda más amplia se refina
+# con más palabras o con los filtros
+SEARCH_LIMIT = 200
+# Peso de una coincidencia en los comentarios frente a una en la propia tarea
+SEARCH_COMMENT_WEIGHT = 0.5
+
+@instrumented
+def search_tasks(texto, estados=None, usuarios=None, fecha_inicio=None, fecha_fin=None,
+                 page_size=SEARCH_PAGE_SIZE, cursor=None):
+    """
+    Busca texto en el nombre, la descripción y los comentarios de las tareas
+    que cumplen los filtros de get_filtered_tasks, con los índices de texto.
+    Devuelve (tareas, cursor_siguiente) ordenadas por relevancia; el cursor es
+    la posición de la siguiente página y es None cuando no hay más
+    """
+    texto = texto.strip()
+    if not texto:
+        return [], None
+    db = connect_to_mongo("users")
+    tasks_collection = db.tasks
+    query = filtered_query(estados, usuarios, fecha_inicio, fecha_fin)
+    key = ("search",) + _filtered_key(estados, usuarios, fecha_inicio, fecha_fin)[1:] + (texto,)
+
+    def load():
+        score = {"$meta": "textScore"}
+        tasks = {
+            task["_id"]: task
+            for task in tasks_collection.find({"$text": {"$search": texto}, **query}, {**TASK_LIST_PROJECTION, "score": score})
+            .sort([("score", score)])
+            .limit(SEARCH_LIMIT)
+        }
+
+        # Mejor coincidencia en los comentarios de cada tarea que cumple los
+        # filtros; se filtra antes de recortar para no perder tareas que solo
+        # quedan por debajo del corte en la colección completa
+        for row in db.comments.aggregate([
+            {"$match": {"$text": {"$search": texto}}},
+            {"$project": {"task_id": 1, "score": score}},
+            {"$group": {"_id": "$task_id", "score": {"$max": "$score"}}},
+            {"$lookup": {
+                "from": "tasks",
+                "localField": "_id",
+                "foreignField": "_id",
+                "pipeline": [{"$match": query}, {"$project": TASK_LIST_PROJECTION}],
+                "as": "task"
+            }},
+            {"$unwind": "$task"},
+            {"$sort": {"score": -1}},
+            {"$limit": SEARCH_LIMIT}
+        ]):
+            task = tasks.setdefault(row["_id"], dict(row["task"], score=0))
+            task["score"] += SEARCH_COMMENT_WEIGHT * row["score"]
+
+        return sorted(tasks.values(), key=lambda task: (-task["score"], task["fecha_hora"], task["_id"]))[:SEARCH_LIMIT]
+
+    ranked = _cached(key, load)
+    start = cursor or 0
+    end = start + page_size
+    return _with_pending(ranked[start:end]), end if end < len(ranked) else None
+
+def iter_filtered_tasks(estados=None, usuarios=None, fecha_inicio=None, fecha_fin=None, batch_size=1000):
+    """
+    Recorre las tareas de get_filtered_tasks con un cursor, ordenadas por
+    (fecha_hora, _id), sin caché y sin cargarlas todas en memoria
+    """
+    db = connect_to_mongo("users")
+    cursor = (
+        db.tasks.find(filtered_query(estados, usuarios, fecha_inicio, fecha_fin), TASK_LIST_PROJECTION)
+        .sort([("fecha_hora", 1), ("_id", 1)])
+        .batch_size(batch_size)
+    )
+    with cursor:
+        yield from cursor
+
+@instrumented
+def insert_tasks(documents):
+    """
+    Inserta tareas ya validadas (ver new_task_document) con un insert_many sin
+    orden. Devuelve {índice: error} de las que no se pudieron insertar
+    """
+    if not documents:
+        return {}
+    db = connect_to_mongo("users")
+
+    errors = {}
+    try:
+        db.tasks.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        errors = {error["index"]: error["errmsg"] for error in e.details.get("writeErrors", [])}
+
+    inserted = [document for index, document in enumerate(documents) if index not in errors]
+    _update_daily_summary(db, *[(None, document) for document in inserted])
+    _remember_writes(*[(document["_id"], document["ultima_actualizacion"]) for document in inserted])
+    invalidate_tasks(*inserted)
+    return errors
+
+def statistics_range(fecha_inicio, fecha_fin):
+    """Rango de fecha_hora de fecha_inicio a fecha_fin, ambas fechas incluidas"""
+    return (
+        datetime.combine(fecha_inicio, datetime.min.time()),
+        datetime.combine(fecha_fin + timedelta(days=1), datetime.min.time())
+    )
+
+@instrumented
+def get_task_statistics(fecha_inicio, fecha_fin):
+    """
+    Métricas del equipo para las tareas entre fecha_inicio y fecha_fin en una
+    sola agregación con $facet. Devuelve {"totales", "por_asignado",
+    "por_estado", "por_semana"}, con conteos (no porcentajes):
+    total, completadas, vencidas, con_extension e imposibles
+    """
+    db = connect_to_mongo("users")
+    tasks_collection = db.tasks
+    start, end = statistics_range(fecha_inicio, fecha_fin)
+    now = datetime.now()
+
+    def flag(condition):
+        return {"$sum": {"$cond": [condition, 1, 0]}}
+
+    # num_extensiones y num_imposibles cuentan también las solicitudes ya
+    # resueltas; las tareas anteriores a esos contadores solo cuentan por estado
+    counters = {
+        "total": {"$sum": 1},
+        "completadas": flag({"$eq": ["$estado", "completada"]}),
+        "vencidas": flag({"$and": [{"$ne": ["$estado", "completada"]}, {"$lt": ["$fecha_hora", now]}]}),
+        "con_extension": flag({"$or": [
+            {"$gt": [{"$ifNull": ["$num_extensiones", 0]}, 0]},
+            {"$eq": ["$estado", "extension_solicitada"]}
+        ]}),
+        "imposibles": flag({"$or": [
+            {"$gt": [{"$ifNull": ["$num_imposibles", 0]}, 0]},
+            {"$eq": ["$estado", "imposible"]}
+        ]}),
+    }
+    pipeline = [
+        {"$match": {"fecha_hora": {"$gte": start, "$lt": end}}},
+        {"$project": {
+            "_id": 0, "fecha_hora": 1, "estado": 1, "asignado_a": 1, "num_extensiones": 1, "num_imposibles": 1
+        }},
+        {"$facet": {
+            "totales": [{"$group": dict(counters, _id=None)}],
+            "por_asignado": [
+                {"$group": dict(counters, _id={"$ifNull": ["$asignado_a", "Sin asignar"]})},
+                {"$sort": {"_id": 1}}
+            ],
+            "por_estado": [
+                {"$group": {"_id": {"$ifNull": ["$estado", "sin_estado"]}, "total": {"$sum": 1}}},
+                {"$sort": {"_id": 1}}
+            ],
+            "por_semana": [
+                {"$group": dict(counters, _id={"$dateFromParts": {
+                    "isoWeekYear": {"$isoWeekYear": "$fecha_hora"},
+                    "isoWeek": {"$isoWeek": "$fecha_hora"},
+                    "isoDayOfWeek": 1
+                }})},
+                {"$sort": {"_id": 1}}
+            ],
+        }}
+    ]
+
+    def load():
+        result = next(tasks_collection.aggregate(pipeline), {})
+        empty = {field: 0 for field in counters}
+        totales = (result.get("totales") or [dict(empty, _id=None)])[0]
+        return {
+            "totales": {field: totales[field] for field in counters},
+            "por_asignado": [
+                dict({field: row[field] for field in counters}, asignado_a=row["_id"])
+                for row in result.get("por_asignado", [])
+            ],
+            "por_estado": {row["_id"]: row["total"] for row in result.get("por_estado", [])},
+            "por_semana": [
+                dict({field: row[field] for field in counters}, semana=row["_id"])
+                for row in result.get("por_semana", [])
+            ],
+        }
+
+    return _cached(("statistics", fecha_inicio, fecha_fin), load)
+
+@instrumented
+def update_task(task_id, new_name, new_description, new_date, new_time, new_assigned, new_status,
+                expected=None):
     """
     Actualiza los detalles de una tarea
     """
@@ -309,34 +2397,191 @@ def update_task(task_id, new_name, new_description, new_date, new_time, new_assi
     
     new_datetime = datetime.combine(new_date, new_time)
     
-    result = tasks_collection.update_one(
-        {"_id": ObjectId(task_id)},
+    return _update_task(
+        tasks_collection,
+        task_id,
         {
             "$set": {
                 "nombre": new_name,
                 "descripcion": new_description,
                 "fecha_hora": new_datetime,
                 "asignado_a": new_assigned,
-                "estado": new_status,
-                "ultima_actualizacion": datetime.now()
-            },
-            "$push": {
-                "comentarios": {
-                    "texto": "Tarea actualizada por el administrador",
-                    "fecha": datetime.now()
-                }
+                "estado": new_status
             }
-        }
+        },
+        comment="Tarea actualizada por el administrador",
+        expected=expected
     )
-    
-    return result.modified_count > 0
 
-def delete_task(task_id):
+@instrumented
+def bulk_update_tasks(updates):
+    """
+    Aplica los cambios de varias tareas en un solo bulk_write. updates es una
+    lista de (tarea_original, cambios), donde cambios solo trae los campos
+    modificados. Cada fila solo se aplica si la tarea sigue con la
+    ultima_actualizacion de tarea_original. Devuelve un resultado por fila:
+    task_id, ok, status (como MutationResult), campos y error
+    """
+    db = connect_to_mongo("users")
+    tasks_collection = db.tasks
+
+    if not updates:
+        return []
+
+    now = _now()
+    requests = []
+    comment_docs = []
+    for task, changes in updates:
+        comment_doc = {"texto": "Tarea actualizada por el administrador", "fecha": now}
+        comment_docs.append(comment_doc)
+        requests.append(UpdateOne(
+            _task_filter(task["_id"], task.get("ultima_actualizacion")),
+            _with_comment({"$set": dict(changes, ultima_actualizacion=now)}, comment_doc)
+        ))
+
+    errors = {}
+    try:
+        result = tasks_collection.bulk_write(requests, ordered=False)
+        matched = result.matched_count
+    except BulkWriteError as e:
+        errors = {error["index"]: error["errmsg"] for error in e.details.get("writeErrors", [])}
+        matched = e.details.get("nMatched", 0)
+
+    # bulk_write no dice qué filas no coincidieron; solo si faltan se consulta
+    # cuáles quedaron con la marca de este lote
+    statuses = {}
+    if matched < len(updates) - len(errors):
+        ids = [ObjectId(task["_id"]) for task, _ in updates]
+        current = {
+            task["_id"]: task["ultima_actualizacion"] == now
+            for task in tasks_collection.find({"_id": {"$in": ids}}, {"ultima_actualizacion": 1})
+        }
+        for index, (task, _) in enumerate(updates):
+            applied = current.get(ObjectId(task["_id"]))
+            if index not in errors and not applied:
+                statuses[index] = "not_found" if applied is None else "conflict"
+
+    results = []
+    comments = []
+    touched = []
+    written = []
+    summary_pairs = []
+    for index, (task, changes) in enumerate(updates):
+        status = "error" if index in errors else statuses.get(index, "ok")
+        ok = status == "ok"
+        error = errors.get(index)
+        if status in ("conflict", "not_found"):
+            error = MutationResult.MESSAGES[status]
+        results.append({
+            "task_id": task["_id"],
+            "ok": ok,
+            "status": status,
+            "campos": sorted(changes),
+            "error": error
+        })
+        if ok:
+            comments.append(dict(comment_docs[index], task_id=ObjectId(task["_id"])))
+            touched.extend([task, dict(task, **changes)])
+            written.append((ObjectId(task["_id"]), now))
+            summary_pairs.append((task, dict(task, **changes)))
+        elif status == "conflict":
+            touched.append(task)
+
+    if comments:
+        db.comments.insert_many(comments, ordered=False)
+    _update_daily_summary(db, *summary_pairs)
+    _remember_writes(*written)
+    invalidate_tasks(*touched)
+    return results
+
+@instrumented
+def delete_task(task_id, expected=None):
     """
     Elimina una tarea
     """
     db = connect_to_mongo("users")
     tasks_collection = db.tasks
     
-    result = tasks_collection.delete_one({"_id": ObjectId(task_id)})
-    return result.deleted_count > 0
\ No newline at end of file
+    return _delete_task(tasks_collection, task_id, expected)
+
+
+def query_shapes():
+    """
+    Formas de consulta que usa este módulo: nombre -> (colección, filtro, orden)
+    o (colección, filtro, orden, hint) si la consulta fuerza un índice. Los
+    valores de ejemplo no importan, solo la forma del filtro.
+    """
+    today = datetime.now().date()
+    return {
+        "login": ("data", {"username": ""}, None),
+        "get_month_tasks": ("tasks", month_query(today.year, today.month), "fecha_hora"),
+        "get_day_tasks": ("tasks", day_query(today.year, today.month, today.day), "fecha_hora"),
+        "get_pending_admin_tasks": ("tasks", pending_admin_query(), "fecha_hora"),
+        "get_upcoming_tasks": ("tasks", upcoming_query(["Juan", "Los dos"], datetime.now(), datetime.now()), "fecha_hora"),
+        "get_upcoming_tasks (todos)": ("tasks", upcoming_query(None, datetime.now(), datetime.now()), "fecha_hora"),
+        "get_task_changes": ("tasks", changes_query(datetime.now()), None),
+        "get_task_changes (mes)": (
+            "tasks", changes_query(datetime.now(), *month_range(today.year, today.month), [ObjectId()]), None
+        ),
+        "get_task_changes (eliminadas)": ("deleted_tasks", {"eliminado": {"$gte": datetime.now()}}, None),
+        "get_task_comments": ("comments", {"task_id": ObjectId()}, "fecha"),
+        "get_month_summary": ("task_daily_summary", {"_id": {"$gte": datetime.now(), "$lt": datetime.now()}}, None),
+        "get_filtered_tasks": (
+            "tasks",
+            filtered_query(["pendiente", "completada"], ["Juan", "Jose"], today, today + timedelta(days=30)),
+            "fecha_hora"
+        ),
+        "get_filtered_tasks (solo fechas)": (
+            "tasks", filtered_query(fecha_inicio=today, fecha_fin=today + timedelta(days=30)), "fecha_hora"
+        ),
+        "get_filtered_tasks (solo estados)": ("tasks", filtered_query(estados=["pendiente"]), "fecha_hora"),
+        "migrate_comments": ("tasks", LEGACY_COMMENTS_QUERY, None, "comentarios_sin_migrar"),
+        "search_tasks": ("tasks", {"$text": {"$search": "tarea"}}, None),
+        "search_tasks (comentarios)": ("comments", {"$text": {"$search": "tarea"}}, None),
+        "get_filtered_tasks_page": (
+            "tasks",
+            after_cursor_query(
+                filtered_query(["pendiente", "completada"], ["Juan", "Jose"], today, today + timedelta(days=30)),
+                (datetime.combine(today, datetime.min.time()), ObjectId())
+            ),
+            "fecha_hora"
+        ),
+    }
+
+
+def _plan_stages(plan):
+    """Recorre un plan de explain() y devuelve todas sus etapas"""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(_plan_stages(value))
+    return stages
+
+
+def explain_query_shapes():
+    """Ejecuta explain() sobre cada forma de consulta y devuelve sus etapas ganadoras"""
+    db = connect_to_mongo("users")
+    plans = {}
+    for name, (collection_name, query, sort, *hint) in query_shapes().items():
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort, 1)
+        if hint:
+            cursor = cursor.hint(hint[0])
+        plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        plans[name] = _plan_stages(plan)
+    return plans
+
+
+def verify_query_plans():
+    """Falla si alguna forma de consulta recae en un COLLSCAN"""
+    plans = explain_query_shapes()
+    scans = [name for name, stages in plans.items() if "COLLSCAN" in stages]
+    if scans:
+        raise RuntimeError(f"Consultas sin índice (COLLSCAN): {', '.join(scans)}")
+    return plans